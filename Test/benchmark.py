@@ -0,0 +1,231 @@
+import sys
+import os
+import argparse
+import datetime
+import json
+import resource
+import subprocess
+import threading
+import time
+import queue
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, parent_dir)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import mock_server
+
+# End-to-end fetch_applications -> filter_candidates -> add_resumes benchmark
+# against Test/mock_server.py. Every scenario runs in a fresh interpreter so
+# caches, pools and peak RSS don't carry over, and results land in JSON so two
+# commits can be compared with --compare.
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_results')
+
+DEFAULT_SCALES = [100, 1000, 10000]
+DEFAULT_FILE_SIZES = [300 * 1024]
+
+# The mock serves Ashby, Drive and downloads from one host, so the per-host
+# limiter would cap the whole run at the default 50 req/s. Loosen it so the
+# benchmark measures the exporter rather than the limiter settings.
+MOCK_HOST_LIMITS = {'rate': 1000, 'burst': 1000, 'max_concurrency': 64}
+
+STAGES = ['candidate_info', 'file_info', 'download', 'upload']
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+def summarize(values):
+    return {
+        'count': len(values),
+        'p50': percentile(values, 0.5),
+        'p99': percentile(values, 0.99),
+        'max': max(values) if values else None
+    }
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=parent_dir,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_scenario():
+    # Runs inside the child process, the mock server URLs come in through the environment
+    import api_calls
+    import events
+    import rate_limiter
+
+    host = api_calls.ASHBY_BASE_URL.split('//')[1].split(':')[0]
+    rate_limiter.HOST_LIMITS[host] = MOCK_HOST_LIMITS
+
+    latencies = {stage: [] for stage in STAGES}
+
+    # Time each candidate.info call without changing what filter_candidates does
+    fetch_candidate_info = api_calls.fetch_candidate_info
+    def timed_fetch_candidate_info(ashby_token, candidate_id):
+        started = time.monotonic()
+        try:
+            return fetch_candidate_info(ashby_token, candidate_id)
+        finally:
+            latencies['candidate_info'].append(time.monotonic() - started)
+    api_calls.fetch_candidate_info = timed_fetch_candidate_info
+
+    # The transfer stages already report their timings as run events
+    run_id = 'benchmark'
+    subscriber = events.subscribe(run_id)
+    stage_names = {'file_info': 'file_info', 'downloaded': 'download', 'uploaded': 'upload'}
+    done = threading.Event()
+    def drain():
+        while not done.is_set() or not subscriber.empty():
+            try:
+                event = subscriber.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            stage = stage_names.get(event['type'])
+            if stage is not None:
+                latencies[stage].append(event['seconds'])
+    drainer = threading.Thread(target=drain, daemon=True)
+    drainer.start()
+
+    phases = {}
+    started = time.monotonic()
+    candidates, raw_data = api_calls.fetch_applications('benchmark', {'jobId': 'job-00000'})
+    phases['fetch_applications'] = time.monotonic() - started
+
+    phase_started = time.monotonic()
+    errors = []
+    filtered_candidates = api_calls.filter_candidates('benchmark', candidates, errors=errors)
+    phases['filter_candidates'] = time.monotonic() - phase_started
+
+    phase_started = time.monotonic()
+    results = api_calls.add_resumes('benchmark', 'benchmark', filtered_candidates, 'Benchmark', run_id=run_id)
+    phases['add_resumes'] = time.monotonic() - phase_started
+    total = time.monotonic() - started
+
+    done.set()
+    drainer.join()
+    events.unsubscribe(run_id, subscriber)
+
+    failed = [result for result in results if result['error']]
+    return {
+        'candidates': len(candidates),
+        'filtered': len(filtered_candidates),
+        'uploaded': len(results) - len(failed),
+        'failed': len(failed) + len(errors),
+        'seconds': total,
+        'candidates_per_second': len(candidates) / total if total else None,
+        'phases': phases,
+        'latency': {stage: summarize(values) for stage, values in latencies.items()},
+        # Linux reports ru_maxrss in KiB
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    }
+
+
+def benchmark(candidates, file_size, mock_settings):
+    server = mock_server.start_server(candidates=candidates, file_size=file_size, **mock_settings)
+    try:
+        env = dict(os.environ, **server.environ())
+        completed = subprocess.run([sys.executable, os.path.abspath(__file__), '--scenario'],
+                                   env=env, cwd=parent_dir, capture_output=True, text=True)
+        if completed.returncode != 0:
+            raise RuntimeError(f"Scenario failed:\n{completed.stderr}")
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+        result['requests'] = {route: stats['requests'] for route, stats in server.stats().items()}
+        result['request_status'] = {route: stats['status'] for route, stats in server.stats().items()}
+        return result
+    finally:
+        server.stop()
+
+def print_result(scenario):
+    result = scenario['result']
+    latency = result['latency']
+    stages = "  ".join(
+        f"{stage} p50 {latency[stage]['p50'] * 1000:.0f}ms p99 {latency[stage]['p99'] * 1000:.0f}ms"
+        for stage in STAGES if latency[stage]['count']
+    )
+    print(f"{scenario['candidates']:>6} candidates  {scenario['file_size']:>9} B  "
+          f"{result['candidates_per_second']:8.1f} cand/s  {result['seconds']:7.1f}s  "
+          f"{sum(result['requests'].values()):>6} requests  {result['peak_rss_mb']:6.0f} MB  "
+          f"failed {result['failed']}")
+    print(f"        {stages}")
+
+def compare(previous_path, scenarios):
+    with open(previous_path, 'r', encoding='utf-8') as f:
+        previous = json.load(f)
+    before = {(item['candidates'], item['file_size']): item['result'] for item in previous['scenarios']}
+    print(f"\nCompared with {previous.get('revision')} ({previous_path})")
+    for scenario in scenarios:
+        old = before.get((scenario['candidates'], scenario['file_size']))
+        if old is None:
+            continue
+        new = scenario['result']
+        change = (new['candidates_per_second'] / old['candidates_per_second'] - 1) * 100
+        print(f"{scenario['candidates']:>6} candidates  {scenario['file_size']:>9} B  "
+              f"{old['candidates_per_second']:8.1f} -> {new['candidates_per_second']:8.1f} cand/s ({change:+.1f}%)  "
+              f"peak RSS {old['peak_rss_mb']:.0f} -> {new['peak_rss_mb']:.0f} MB")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Resume export throughput and memory benchmark')
+    parser.add_argument('--scenario', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--scales', default=','.join(map(str, DEFAULT_SCALES)),
+                        help='comma separated candidate counts')
+    parser.add_argument('--file-sizes', default=','.join(map(str, DEFAULT_FILE_SIZES)),
+                        help='comma separated resume sizes in bytes')
+    parser.add_argument('--latency', type=float, default=0.02, help='mock seconds per response')
+    parser.add_argument('--bandwidth', type=int, help='mock bytes per second per connection')
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--output', help='results file, defaults to Test/benchmark_results/<time>_<revision>.json')
+    parser.add_argument('--compare', help='earlier results file to compare against')
+    args = parser.parse_args(argv)
+
+    if args.scenario:
+        print(json.dumps(run_scenario()))
+        return
+
+    mock_settings = {
+        'latency': args.latency,
+        'bandwidth': args.bandwidth,
+        'throttle_rate': args.throttle_rate,
+        'error_rate': args.error_rate,
+        'retry_after': 0.1
+    }
+    scenarios = []
+    for file_size in [int(value) for value in args.file_sizes.split(',')]:
+        for candidates in [int(value) for value in args.scales.split(',')]:
+            scenario = {
+                'candidates': candidates,
+                'file_size': file_size,
+                'result': benchmark(candidates, file_size, mock_settings)
+            }
+            print_result(scenario)
+            scenarios.append(scenario)
+
+    revision = git_revision()
+    report = {
+        'revision': revision,
+        'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        'mock': mock_settings,
+        'scenarios': scenarios
+    }
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+        output = os.path.join(RESULTS_DIR, f"{stamp}_{revision or 'unknown'}.json")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        compare(args.compare, scenarios)
+
+if __name__ == '__main__':
+    main()
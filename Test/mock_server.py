@@ -0,0 +1,465 @@
+import sys
+import os
+import argparse
+import copy
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+# Local stand-in for the Ashby and Google Drive endpoints api_calls.py talks to,
+# seeded from samples/ so the real HTTP, pagination and upload code can be load
+# tested offline. Run it and export the printed variables before starting
+# server.py, or call start_server() from a test script.
+
+SAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'samples')
+
+ASHBY_PREFIX = '/ashby'
+DRIVE_PREFIX = '/drive/v3'
+UPLOAD_PREFIX = '/upload/drive/v3'
+FILES_PREFIX = '/signed'
+
+# Bytes written per socket send, bandwidth is throttled between chunks
+TRANSFER_CHUNK_SIZE = 64 * 1024
+
+DEFAULT_CONFIG = {
+    # Data set size, jobs default to the ones in the sample file
+    'jobs': None,
+    'candidates': 200,
+    'page_size': 100,
+    # Resume size in bytes, None serves the sample PDF as is
+    'file_size': None,
+    # Share of candidates with no resume on file
+    'no_resume_rate': 0.1,
+    # Added to every response, in seconds
+    'latency': 0.02,
+    'latency_jitter': 0.01,
+    # Per connection, in bytes per second, None for unthrottled
+    'bandwidth': None,
+    # Share of requests answered with a 429 (403 rateLimitExceeded on Drive) or a 503
+    'throttle_rate': 0.0,
+    'error_rate': 0.0,
+    'retry_after': 1
+}
+
+
+def _load_sample(name):
+    with open(os.path.join(SAMPLES_DIR, name), 'r', encoding='utf-8') as f:
+        return f.read()
+
+def _unit_hash(value):
+    # Stable value in [0, 1) so the same candidate always gets the same outcome
+    return int(hashlib.sha256(value.encode()).hexdigest()[:8], 16) / 0x100000000
+
+
+class MockState:
+    def __init__(self, config):
+        self.config = config
+        self.lock = threading.Lock()
+        self.sample_jobs = json.loads(_load_sample('sample_[job.list].json'))['results']
+        self.sample_applications = json.loads(_load_sample('sample_[application.list].json'))['results']
+        self.sample_candidate = json.loads(_load_sample('sample_[candidate.info].json'))['results']
+
+        pdf = bytes.fromhex(_load_sample('sample_[pdf.hex].txt').strip())
+        file_size = config['file_size'] or len(pdf)
+        self.resume = (pdf * (file_size // len(pdf) + 1))[:file_size]
+
+        # Drive side: file ID -> metadata, upload session ID -> session
+        self.drive_files = {}
+        self.upload_sessions = {}
+        self.stats = {}
+
+    def count(self, route, status, bytes_in=0, bytes_out=0):
+        with self.lock:
+            entry = self.stats.setdefault(route, {'requests': 0, 'status': {}, 'bytes_in': 0, 'bytes_out': 0})
+            entry['requests'] += 1
+            entry['status'][str(status)] = entry['status'].get(str(status), 0) + 1
+            entry['bytes_in'] += bytes_in
+            entry['bytes_out'] += bytes_out
+
+    def snapshot(self):
+        with self.lock:
+            return copy.deepcopy(self.stats)
+
+    def job(self, index):
+        job = copy.deepcopy(self.sample_jobs[index % len(self.sample_jobs)])
+        job['id'] = f"job-{index:05d}"
+        job['title'] = f"{job['title']} {index}"
+        return job
+
+    def application(self, index):
+        application = copy.deepcopy(self.sample_applications[index % len(self.sample_applications)])
+        application['id'] = f"application-{index:06d}"
+        application['candidate']['id'] = f"candidate-{index:06d}"
+        application['candidate']['name'] = f"{application['candidate']['name']} {index}"
+        return application
+
+    def candidate_info(self, candidate_id):
+        candidate = copy.deepcopy(self.sample_candidate)
+        candidate['id'] = candidate_id
+        candidate['name'] = f"Candidate {candidate_id}"
+        if _unit_hash(candidate_id) < self.config['no_resume_rate']:
+            candidate.pop('resumeFileHandle', None)
+            candidate['fileHandles'] = []
+        else:
+            candidate['resumeFileHandle']['handle'] = f"handle-{candidate_id}"
+            for file_handle in candidate.get('fileHandles', []):
+                file_handle['handle'] = f"handle-{candidate_id}"
+        return candidate
+
+    def add_drive_file(self, metadata, size):
+        file_id = uuid.uuid4().hex
+        with self.lock:
+            self.drive_files[file_id] = {
+                'id': file_id,
+                'name': metadata.get('name'),
+                'mimeType': metadata.get('mimeType'),
+                'parents': metadata.get('parents', []),
+                'appProperties': metadata.get('appProperties', {}),
+                'size': str(size)
+            }
+            return dict(self.drive_files[file_id])
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes, don't let Nagle hold the body back
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def state(self):
+        return self.server.state
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_PUT(self):
+        self._dispatch('PUT')
+
+    def _dispatch(self, method):
+        config = self.state.config
+        url = urlsplit(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        # Always drain the body first so keep-alive connections stay in sync
+        body = self._read_body()
+
+        route, handler = self._route(method, url.path, query)
+        if handler is None:
+            self._send_json(route, {'error': 'not found'}, 404, bytes_in=len(body))
+            return
+
+        time.sleep(config['latency'] + random.uniform(0, config['latency_jitter']))
+
+        drive = route.startswith('drive') or route.startswith('upload')
+        roll = random.random()
+        if route != 'stats' and roll < config['throttle_rate']:
+            headers = {'Retry-After': str(config['retry_after'])}
+            if drive:
+                error = {'error': {'code': 403, 'errors': [{'reason': 'rateLimitExceeded'}]}}
+                self._send_json(route, error, 403, headers, bytes_in=len(body))
+            else:
+                self._send_json(route, {'success': False, 'errors': ['rate_limit']}, 429, headers, bytes_in=len(body))
+            return
+        if route != 'stats' and roll < config['throttle_rate'] + config['error_rate']:
+            self._send_json(route, {'error': 'unavailable'}, 503, bytes_in=len(body))
+            return
+
+        handler(route, query, body)
+
+    def _route(self, method, path, query):
+        if method == 'GET' and path == '/stats':
+            return 'stats', self._stats
+        if method == 'POST' and path.startswith(ASHBY_PREFIX + '/'):
+            endpoint = path[len(ASHBY_PREFIX) + 1:]
+            handlers = {
+                'job.list': self._job_list,
+                'application.list': self._application_list,
+                'candidate.info': self._candidate_info,
+                'file.info': self._file_info
+            }
+            return endpoint, handlers.get(endpoint)
+        if method == 'GET' and path.startswith(FILES_PREFIX + '/'):
+            return 'download', self._download
+        if path == DRIVE_PREFIX + '/files':
+            if method == 'GET':
+                return 'drive.list', self._drive_list
+            if method == 'POST':
+                return 'drive.folder', self._drive_create
+        if method == 'GET' and path == DRIVE_PREFIX + '/about':
+            return 'drive.about', self._drive_about
+        if method == 'POST' and path.startswith(DRIVE_PREFIX + '/files/') and path.endswith('/copy'):
+            return 'drive.copy', self._drive_copy
+        if path == UPLOAD_PREFIX + '/files':
+            if method == 'POST' and query.get('uploadType') == 'multipart':
+                return 'upload.multipart', self._upload_multipart
+            if method == 'POST' and query.get('uploadType') == 'resumable':
+                return 'upload.session', self._upload_session
+            if method == 'PUT' and 'upload_id' in query:
+                return 'upload.chunk', self._upload_chunk
+        return 'unknown', None
+
+    # Ashby
+
+    def _page(self, route, body, total, build):
+        payload = json.loads(body or b'{}')
+        offset = int(payload.get('cursor') or 0)
+        limit = min(int(payload.get('limit') or self.state.config['page_size']), self.state.config['page_size'])
+        end = min(offset + limit, total)
+        data = {
+            'success': True,
+            'results': [build(index) for index in range(offset, end)],
+            'moreDataAvailable': end < total
+        }
+        if end < total:
+            data['nextCursor'] = str(end)
+        self._send_json(route, data, bytes_in=len(body))
+
+    def _job_list(self, route, query, body):
+        total = self.state.config['jobs'] or len(self.state.sample_jobs)
+        self._page(route, body, total, self.state.job)
+
+    def _application_list(self, route, query, body):
+        self._page(route, body, self.state.config['candidates'], self.state.application)
+
+    def _candidate_info(self, route, query, body):
+        candidate_id = json.loads(body)['id']
+        self._send_json(route, {'success': True, 'results': self.state.candidate_info(candidate_id)}, bytes_in=len(body))
+
+    def _file_info(self, route, query, body):
+        file_handle = json.loads(body)['fileHandle']
+        url = f"{self.base_url}{FILES_PREFIX}/{file_handle}"
+        self._send_json(route, {'success': True, 'results': {'url': url}}, bytes_in=len(body))
+
+    def _download(self, route, query, body):
+        content = self.state.resume
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/pdf')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self._write_throttled(content)
+        self.state.count(route, 200, bytes_out=len(content))
+
+    # Drive
+
+    def _drive_list(self, route, query, body):
+        q = query.get('q', '')
+        parent = re.search(r"'((?:[^'\\]|\\.)*)' in parents", q)
+        names = [_unquote(name) for name in re.findall(r"name='((?:[^'\\]|\\.)*)'", q)]
+        with self.state.lock:
+            drive_files = [dict(item) for item in self.state.drive_files.values()]
+
+        if parent:
+            parent_id = _unquote(parent.group(1))
+            matches = [item for item in drive_files if parent_id in item['parents']]
+            if names:
+                matches = [item for item in matches if item['name'] in names]
+        else:
+            matches = [item for item in drive_files if item['name'] in names]
+        if 'mimeType=' in q:
+            mime_type = re.search(r"mimeType='([^']*)'", q).group(1)
+            matches = [item for item in matches if item['mimeType'] == mime_type]
+
+        offset = int(query.get('pageToken') or 0)
+        page_size = int(query.get('pageSize') or 100)
+        data = {'files': matches[offset:offset + page_size]}
+        if offset + page_size < len(matches):
+            data['nextPageToken'] = str(offset + page_size)
+        self._send_json(route, data, bytes_in=len(body))
+
+    def _drive_create(self, route, query, body):
+        self._send_json(route, self.state.add_drive_file(json.loads(body), 0), bytes_in=len(body))
+
+    def _drive_about(self, route, query, body):
+        # One account per token, so tests can tell two users' Drives apart
+        token = (self.headers.get('Authorization') or '').split(' ')[-1]
+        permission_id = hashlib.sha256(token.encode()).hexdigest()[:20]
+        self._send_json(route, {'user': {'permissionId': permission_id}}, bytes_in=len(body))
+
+    def _drive_copy(self, route, query, body):
+        source_id = urlsplit(self.path).path[len(DRIVE_PREFIX + '/files/'):-len('/copy')]
+        with self.state.lock:
+            source = self.state.drive_files.get(source_id)
+            source = dict(source) if source is not None else None
+        if source is None:
+            error = {'error': {'code': 404, 'message': f'File not found: {source_id}.'}}
+            self._send_json(route, error, 404, bytes_in=len(body))
+            return
+        metadata = dict(source, **json.loads(body or b'{}'))
+        self._send_json(route, self.state.add_drive_file(metadata, int(source['size'])), bytes_in=len(body))
+
+    def _upload_multipart(self, route, query, body):
+        boundary = self.headers['Content-Type'].split('boundary=')[-1].encode()
+        parts = body.split(b'--' + boundary)
+        metadata = json.loads(parts[1].split(b'\r\n\r\n', 1)[1])
+        content = parts[2].split(b'\r\n\r\n', 1)[1][:-2]
+        self._send_json(route, self.state.add_drive_file(metadata, len(content)), bytes_in=len(body))
+
+    def _upload_session(self, route, query, body):
+        upload_id = uuid.uuid4().hex
+        with self.state.lock:
+            self.state.upload_sessions[upload_id] = {
+                'metadata': json.loads(body),
+                'size': int(self.headers.get('X-Upload-Content-Length') or 0),
+                'received': 0
+            }
+        location = f"{self.base_url}{UPLOAD_PREFIX}/files?uploadType=resumable&upload_id={upload_id}"
+        self._send_json(route, None, 200, {'Location': location}, bytes_in=len(body))
+
+    def _upload_chunk(self, route, query, body):
+        with self.state.lock:
+            session = self.state.upload_sessions.get(query['upload_id'])
+        if session is None:
+            self._send_json(route, {'error': 'no such upload'}, 404, bytes_in=len(body))
+            return
+
+        content_range = self.headers.get('Content-Range', '')
+        match = re.match(r'bytes (\d+)-(\d+)/(\d+)', content_range)
+        if match:
+            start, end, total = map(int, match.groups())
+            # Only accept the chunk that continues what we already hold
+            if start == session['received']:
+                session['received'] = end + 1
+        else:
+            total = session['size']
+
+        if session['received'] < total:
+            headers = {'Range': f"bytes=0-{session['received'] - 1}"} if session['received'] else {}
+            self._send_json(route, None, 308, headers, bytes_in=len(body))
+            return
+
+        with self.state.lock:
+            self.state.upload_sessions.pop(query['upload_id'], None)
+        self._send_json(route, self.state.add_drive_file(session['metadata'], total), bytes_in=len(body))
+
+    def _stats(self, route, query, body):
+        self._send_json(route, self.state.snapshot())
+
+    # Transport
+
+    def _read_body(self):
+        remaining = int(self.headers.get('Content-Length') or 0)
+        chunks = []
+        while remaining > 0:
+            chunk = self.rfile.read(min(remaining, TRANSFER_CHUNK_SIZE))
+            if not chunk:
+                break
+            chunks.append(chunk)
+            remaining -= len(chunk)
+            self._throttle(len(chunk))
+        return b''.join(chunks)
+
+    def _write_throttled(self, content):
+        for start in range(0, len(content), TRANSFER_CHUNK_SIZE):
+            chunk = content[start:start + TRANSFER_CHUNK_SIZE]
+            self.wfile.write(chunk)
+            self._throttle(len(chunk))
+
+    def _throttle(self, size):
+        bandwidth = self.state.config['bandwidth']
+        if bandwidth:
+            time.sleep(size / bandwidth)
+
+    def _send_json(self, route, data, status=200, headers=None, bytes_in=0):
+        content = json.dumps(data).encode() if data is not None else b''
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+        if route != 'stats':
+            self.state.count(route, status, bytes_in, len(content))
+
+
+def _unquote(value):
+    return value.replace("\\'", "'").replace("\\\\", "\\")
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0, **config):
+        super().__init__((host, port), MockHandler)
+        unknown = set(config) - set(DEFAULT_CONFIG)
+        if unknown:
+            raise ValueError(f"Unknown mock settings: {', '.join(sorted(unknown))}")
+        self.state = MockState({**DEFAULT_CONFIG, **config})
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def environ(self):
+        # Variables api_calls.py reads its base URLs from
+        return {
+            'ASHBY_BASE_URL': self.base_url + ASHBY_PREFIX,
+            'DRIVE_BASE_URL': self.base_url + DRIVE_PREFIX,
+            'DRIVE_UPLOAD_URL': self.base_url + UPLOAD_PREFIX
+        }
+
+    def stats(self):
+        return self.state.snapshot()
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name='mock-server', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+def start_server(host='127.0.0.1', port=0, **config):
+    return MockServer(host, port, **config).start()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Local Ashby and Google Drive stand-in')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--jobs', type=int)
+    parser.add_argument('--candidates', type=int, default=DEFAULT_CONFIG['candidates'])
+    parser.add_argument('--page-size', type=int, default=DEFAULT_CONFIG['page_size'])
+    parser.add_argument('--file-size', type=int, help='resume size in bytes')
+    parser.add_argument('--no-resume-rate', type=float, default=DEFAULT_CONFIG['no_resume_rate'])
+    parser.add_argument('--latency', type=float, default=DEFAULT_CONFIG['latency'], help='seconds per response')
+    parser.add_argument('--latency-jitter', type=float, default=DEFAULT_CONFIG['latency_jitter'])
+    parser.add_argument('--bandwidth', type=int, help='bytes per second per connection')
+    parser.add_argument('--throttle-rate', type=float, default=DEFAULT_CONFIG['throttle_rate'])
+    parser.add_argument('--error-rate', type=float, default=DEFAULT_CONFIG['error_rate'])
+    parser.add_argument('--retry-after', type=float, default=DEFAULT_CONFIG['retry_after'])
+    args = vars(parser.parse_args(argv))
+
+    host, port = args.pop('host'), args.pop('port')
+    server = MockServer(host, port, **args)
+    for name, value in server.environ().items():
+        print(f"export {name}={value}")
+    print(f"Stats at {server.base_url}/stats", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
@@ -1,47 +1,192 @@
 import requests
+from requests.adapters import HTTPAdapter
 import json
 import base64
+import threading
+import time
+import tempfile
+import uuid
+import io
+import os
+import hashlib
 from datetime import datetime
 import web_logger
+from cache import TTLCache
+from manifest import handle_digest
+import events
+import rate_limiter
+import metrics
+import tracing
+from pipeline import Stage, run_pipeline, iter_pipeline
 
-def fetch_jobs(ashby_token):
+# Overridable so the exporter can be pointed at Test/mock_server.py
+ASHBY_BASE_URL = os.environ.get("ASHBY_BASE_URL", "https://api.ashbyhq.com")
+DRIVE_BASE_URL = os.environ.get("DRIVE_BASE_URL", "https://www.googleapis.com/drive/v3")
+DRIVE_UPLOAD_URL = os.environ.get("DRIVE_UPLOAD_URL", "https://www.googleapis.com/upload/drive/v3")
+
+# Keep-alive connections held per client, sized to cover the widest worker pool
+POOL_SIZE = 16
+
+# Seconds to connect, and to wait for each read once connected. A stalled socket
+# would otherwise hold its host's limiter slot for good.
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 60
+
+# Clients kept per token before the oldest one is dropped
+MAX_CLIENTS = 8
+
+# Streamed downloads are read in chunks into a temp file that stays in memory
+# up to SPOOL_MAX_SIZE and spills to disk above it
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+SPOOL_MAX_SIZE = 1024 * 1024
+
+# Resumable upload chunks, Drive requires a multiple of 256 KiB
+UPLOAD_CHUNK_SIZE = 4 * 256 * 1024
+
+# Files up to this size go up in one multipart request, larger ones resumable
+RESUMABLE_THRESHOLD = 5 * 1024 * 1024
+
+# Folder name -> Drive folder ID lookups are cached process-wide for this long
+FOLDER_CACHE_TTL = 30 * 60
+
+# How long the Drive account behind a Google token is remembered
+ACCOUNT_CACHE_TTL = 30 * 60
+
+# Folder names per batched Drive search, keeps the q parameter a sane length
+FOLDER_SEARCH_BATCH = 40
+
+FOLDER_MIME_TYPE = "application/vnd.google-apps.folder"
+
+# Worker pool width for the candidate.info fan-out in filter_candidates
+CANDIDATE_INFO_WORKERS = 8
+
+# Worker pool widths and queue bound for the add_resumes transfer pipeline
+FILE_INFO_WORKERS = 4
+DOWNLOAD_WORKERS = 8
+UPLOAD_WORKERS = 4
+PIPELINE_QUEUE_SIZE = 16
+
+class _TimeoutAdapter(HTTPAdapter):
+    # requests has no session-wide timeout, every request gets the default unless it sets one
+    def send(self, request, timeout=None, **kwargs):
+        return super().send(request, timeout=timeout or (CONNECT_TIMEOUT, READ_TIMEOUT), **kwargs)
+
+def _build_session(pool_size):
+    session = requests.Session()
+    adapter = _TimeoutAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+def parse_job(job):
+    title = job['title']
+    job_id = job['id']
+    job_info = {
+        'name': title,
+        'id': job_id,
+        'status': job.get('status')
+    }
+    return job_info
+
+def parse_application(application):
+    candidate = application['candidate']
+    candidate_name = candidate['name']
+    candidate_id = candidate['id']           
+    candidate_info = {
+        'name': candidate_name,
+        'id': candidate_id,
+        'updated_at': application.get('updatedAt')
+    }
+    return candidate_info
+
+def parse_candidate_info(data):
+    results = data['results']
+    candidate_name = results['name']
+    candidate_id = results['id']
+    resume_file_handle = None
+    
     try:
-        url = "https://api.ashbyhq.com/job.list"
+        resume_file = results['resumeFileHandle']
+        resume_file_handle = resume_file['handle']
+    except KeyError:
+        try:
+            file_handles = results['fileHandles']
+            for file_handle in file_handles:
+                file_name = file_handle['name']
+                handle = file_handle['handle']
+                
+                if 'resume' in file_name.lower():
+                    resume_file_handle = handle
+                    break
+        except KeyError:
+            resume_file_handle = None #pass
+
+    candidate_info = {
+        'name': candidate_name,
+        'id': candidate_id,
+        'resume_file_handle': resume_file_handle
+    }
+    return candidate_info
+
+def parse_file_info(data):
+    results = data['results']      
+    file_url = results['url']
+    file_info = { 'url': file_url }
+    return file_info
+
+def build_multipart_body(metadata_payload, file_content, content_type):
+    # Metadata and content travel as two parts of one multipart/related body
+    boundary = uuid.uuid4().hex
+    body = b"".join([
+        f"--{boundary}\r\n".encode(),
+        b"Content-Type: application/json; charset=UTF-8\r\n\r\n",
+        json.dumps(metadata_payload).encode(),
+        f"\r\n--{boundary}\r\n".encode(),
+        f"Content-Type: {content_type}\r\n\r\n".encode(),
+        file_content,
+        f"\r\n--{boundary}--".encode()
+    ])
+    return body, f"multipart/related; boundary={boundary}"
+
+def resume_file_name(candidate):
+    return f"{candidate.get('name').replace(' ', '_')}_{candidate.get('id')}_resume.pdf"
+
+class AshbyClient:
+    def __init__(self, ashby_token, base_url=ASHBY_BASE_URL, pool_size=POOL_SIZE):
+        self.base_url = base_url
         encoded_token = base64.b64encode(f"{ashby_token}:".encode()).decode()
 
-        headers = {
+        self.session = _build_session(pool_size)
+        self.session.headers.update({
             "accept": "application/json",
             "content-type": "application/json",
             "authorization": f"Basic {encoded_token}"
-        }
-        
-        all_jobs = []
-        all_raw_data = []
+        })
+
+    def post(self, endpoint, payload=None):
+        # The endpoints used here only read, so a POST is as safe to repeat as a GET
+        response = rate_limiter.request(self.session, "POST", f"{self.base_url}/{endpoint}", endpoint=endpoint,
+                                        idempotent=True, json=payload)
+        response.raise_for_status()
+        return response.json()
+
+    def close(self):
+        self.session.close()
+
+    def iter_pages(self, endpoint, payload=None):
+        # Walk the cursor pagination lazily, one page per request
         cursor = None
-        
         while True:
-            # Prepare payload with cursor if available
-            payload = {}
+            # Prepare payload with filters and cursor
+            page_payload = dict(payload or {})
             if cursor:
-                payload['cursor'] = cursor
-            
-            response = requests.post(url, headers=headers, json=payload if payload else None)
-            response.raise_for_status()
-            
-            data = response.json()
-            all_raw_data.append(data)
-            results = data['results']
-            
-            # Process jobs from this page
-            for job in results:
-                title = job['title']
-                job_id = job['id']
-                job_info = {
-                    'name': title,
-                    'id': job_id
-                }
-                all_jobs.append(job_info)
-            
+                page_payload['cursor'] = cursor
+
+            with tracing.span(endpoint, 'ashby', cursor=cursor) as page_span:
+                data = self.post(endpoint, page_payload if page_payload else None)
+                page_span.set(results=len(data.get('results', [])))
+            yield data
+
             # Check if more data is available
             if not data.get('moreDataAvailable', False):
                 break
@@ -50,153 +195,488 @@ def fetch_jobs(ashby_token):
             if not cursor:
                 break
                 
-            web_logger.INFO(f"Fetched {len(results)} jobs, more available. Next cursor: {cursor}")
-        
-        web_logger.INFO(f"Total jobs fetched: {len(all_jobs)}")
-        return all_jobs, all_raw_data
-        
-    except (requests.exceptions.RequestException, KeyError, json.JSONDecodeError) as e:
-        raise Exception(f"API request failed: {str(e)}")
-
-def fetch_applications(ashby_token, filters):
-    try:
-        url = "https://api.ashbyhq.com/application.list"
-        encoded_token = base64.b64encode(f"{ashby_token}:".encode()).decode()
-        
-        headers = {
-            "accept": "application/json",
-            "content-type": "application/json",
-            "authorization": f"Basic {encoded_token}"
-        }
+            web_logger.DEBUG("Fetched %d from %s, more available. Next cursor: %s", len(data['results']), endpoint, cursor)
 
-        all_candidates = []
-        all_raw_data = []
-        cursor = None
-        
-        while True:
-            # Prepare payload with filters and cursor
-            payload = filters.copy()
-            if cursor:
-                payload['cursor'] = cursor
+    def iter_jobs(self, raw_pages=None):
+        # Yields jobs as each page arrives, raw pages are kept only if a list is passed in
+        try:
+            job_count = 0
+            for data in self.iter_pages("job.list"):
+                if raw_pages is not None:
+                    raw_pages.append(data)
 
-            response = requests.post(url, headers=headers, json=payload)
-            response.raise_for_status()
+                # Process jobs from this page
+                for job in data['results']:
+                    job_count += 1
+                    yield parse_job(job)
             
-            data = response.json()
-            all_raw_data.append(data)
-            results = data['results']
+            web_logger.INFO(f"Total jobs fetched: {job_count}")
             
-            # Process applications from this page
-            for application in results:
-                candidate = application['candidate']
-                candidate_name = candidate['name']
-                candidate_id = candidate['id']           
-                candidate_info = {
-                    'name': candidate_name,
-                    'id': candidate_id
-                }
+        except (requests.exceptions.RequestException, KeyError, json.JSONDecodeError) as e:
+            raise Exception(f"API request failed: {str(e)}")
+
+    def iter_applications(self, filters, raw_pages=None):
+        # Yields candidates as each page arrives, raw pages are kept only if a list is passed in
+        try:
+            candidate_count = 0
+            for data in self.iter_pages("application.list", filters):
+                if raw_pages is not None:
+                    raw_pages.append(data)
                 
-                all_candidates.append(candidate_info)
+                # Process applications from this page
+                for application in data['results']:
+                    candidate_count += 1
+                    yield parse_application(application)
             
-            # Check if more data is available
-            if not data.get('moreDataAvailable', False):
-                break
-                
-            cursor = data.get('nextCursor')
-            if not cursor:
-                break
-                
-            web_logger.INFO(f"Fetched {len(results)} applications, more available. Next cursor: {cursor}")
-        
-        web_logger.INFO(f"Total applications fetched: {len(all_candidates)}")
+            web_logger.INFO(f"Total applications fetched: {candidate_count}")
+            
+        except (requests.exceptions.RequestException, KeyError, json.JSONDecodeError) as e:
+            raise Exception(f"API request failed: {str(e)}")
+
+    def fetch_jobs(self):
+        all_raw_data = []
+        all_jobs = list(self.iter_jobs(raw_pages=all_raw_data))
+        return all_jobs, all_raw_data
+
+    def fetch_applications(self, filters):
+        all_raw_data = []
+        all_candidates = list(self.iter_applications(filters, raw_pages=all_raw_data))
         return all_candidates, all_raw_data
-        
-    except (requests.exceptions.RequestException, KeyError, json.JSONDecodeError) as e:
-        raise Exception(f"API request failed: {str(e)}")
 
-def fetch_candidate_info(ashby_token, candidate_id):
-    try:
-        url = "https://api.ashbyhq.com/candidate.info"
-        encoded_token = base64.b64encode(f"{ashby_token}:".encode()).decode()
-        
-        headers = {
-            "accept": "application/json",
-            "content-type": "application/json",
-            "authorization": f"Basic {encoded_token}"
-        }
-        
-        payload = {
-            "id": candidate_id
-        }
-        
-        response = requests.post(url, headers=headers, json=payload)
-        response.raise_for_status()
-        
-        data = response.json()
-        web_logger.INFO(f"Candidate info: {data}")
-        results = data['results']
-        candidate_name = results['name']
-        candidate_id = results['id']
-        resume_file_handle = None
-        
+    def fetch_candidate_info(self, candidate_id):
         try:
-            resume_file = results['resumeFileHandle']
-            resume_file_handle = resume_file['handle']
-        except KeyError:
+            payload = {
+                "id": candidate_id
+            }
+            
+            data = self.post("candidate.info", payload)
+            web_logger.DEBUG("Candidate info: %s", data)
+            candidate_info = parse_candidate_info(data)
+            
+            return candidate_info, data
+            
+        except (requests.exceptions.RequestException, KeyError, json.JSONDecodeError) as e:
+            raise Exception(f"API request failed: {str(e)}")
+
+    def fetch_file_info(self, file_handle):
+        try:
+            payload = {
+                "fileHandle": file_handle
+            }
+            
+            data = self.post("file.info", payload)
+            file_info = parse_file_info(data)
+            
+            return file_info, data
+            
+        except (requests.exceptions.RequestException, KeyError, json.JSONDecodeError) as e:
+            raise Exception(f"API request failed: {str(e)}")
+
+# Keyed by (google_token, folder_name), shared by every DriveClient
+folder_cache = TTLCache(FOLDER_CACHE_TTL)
+
+# google_token -> the Drive permissionId of the token's user
+account_cache = TTLCache(ACCOUNT_CACHE_TTL)
+
+def quote_query_value(value):
+    # Escape a literal for use inside a Drive q expression
+    return "'" + value.replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+class DriveClient:
+    def __init__(self, google_token, base_url=DRIVE_BASE_URL, upload_url=DRIVE_UPLOAD_URL, pool_size=POOL_SIZE):
+        self.google_token = google_token
+        self.base_url = base_url
+        self.upload_url = upload_url
+
+        self.session = _build_session(pool_size)
+        self.session.headers.update({
+            "Authorization": f"Bearer {google_token}"
+        })
+
+    def close(self):
+        self.session.close()
+
+    def request(self, method, url, endpoint, **kwargs):
+        return rate_limiter.request(self.session, method, url, endpoint=endpoint, **kwargs)
+
+    def create(self, url, endpoint, find, parse, **kwargs):
+        # POSTs that create a file or folder aren't resent by rate_limiter.request after a
+        # 5xx or a dropped connection, Drive may have acted on them anyway. Look for what
+        # the POST would have created with find() before sending it again. Returns what
+        # parse() makes of the response, or the file find() came back with.
+        attempt = 0
+        while True:
             try:
-                file_handles = results['fileHandles']
-                for file_handle in file_handles:
-                    file_name = file_handle['name']
-                    handle = file_handle['handle']
-                    
-                    if 'resume' in file_name.lower():
-                        resume_file_handle = handle
-                        break
-            except KeyError:
-                resume_file_handle = None #pass
-
-        candidate_info = {
-            'name': candidate_name,
-            'id': candidate_id,
-            'resume_file_handle': resume_file_handle
+                response = self.request("POST", url, endpoint, **kwargs)
+            except rate_limiter.DROPPED_CONNECTION_ERRORS as e:
+                if attempt >= rate_limiter.MAX_RETRIES:
+                    raise
+                reason = str(e)
+            else:
+                if response.status_code not in rate_limiter.RETRY_STATUS_CODES or attempt >= rate_limiter.MAX_RETRIES:
+                    return parse(response)
+                reason = f"HTTP {response.status_code}"
+                response.close()
+
+            existing = find()
+            if existing is not None:
+                web_logger.WARNING("%s went through despite %s, using %s", endpoint, reason, existing['id'])
+                return existing
+            metrics.api_retries.inc(endpoint=endpoint)
+            delay = rate_limiter.backoff_delay(attempt)
+            web_logger.WARNING("Retrying POST %s in %.1fs after %s (attempt %d)", endpoint, delay, reason, attempt + 1)
+            time.sleep(delay)
+            attempt += 1
+
+    def find_file(self, file_name, folder_id=None, app_properties=None):
+        # The file named file_name in folder_id whose appProperties include app_properties, or None
+        terms = [f"name={quote_query_value(file_name)}", "trashed=false"]
+        if folder_id:
+            terms.append(f"{quote_query_value(folder_id)} in parents")
+        search_params = {
+            "q": " and ".join(terms),
+            "fields": "files(id, name, size, appProperties)",
+            "pageSize": 100
         }
-        
-        return candidate_info, data
-        
-    except (requests.exceptions.RequestException, KeyError, json.JSONDecodeError) as e:
-        raise Exception(f"API request failed: {str(e)}")
+        search_response = self.request("GET", f"{self.base_url}/files", "drive.find", params=search_params)
+        search_response.raise_for_status()
+        for drive_file in search_response.json()['files']:
+            properties = drive_file.get('appProperties') or {}
+            if all(properties.get(key) == value for key, value in (app_properties or {}).items()):
+                return drive_file
+        return None
 
-def fetch_file_info(ashby_token, file_handle):
-    try:
-        url = "https://api.ashbyhq.com/file.info"
-        encoded_token = base64.b64encode(f"{ashby_token}:".encode()).decode()
+    def upload_file(self, file_name, file_data, folder_id=None, app_properties=None):
+        try:
+            file_content = file_data['content']
+            content_type = file_data['content_type']
+            file_size = file_data['file_size']
+            
+            metadata_payload = {
+                "name": file_name,
+                "mimeType": content_type
+            }
+            
+            # Add parent folder if specified
+            if folder_id:
+                metadata_payload["parents"] = [folder_id]
+
+            # Private key/value tags, used to tell which resume a Drive file holds
+            if app_properties:
+                metadata_payload["appProperties"] = app_properties
+
+            # Small files go up with their metadata in one request, large ones in chunks
+            if file_size > RESUMABLE_THRESHOLD:
+                if not hasattr(file_content, 'read'):
+                    file_content = io.BytesIO(file_content)
+                metadata_data, upload_data = self._upload_resumable(metadata_payload, file_content, content_type, file_size)
+            else:
+                if hasattr(file_content, 'read'):
+                    file_content.seek(0)
+                    file_content = file_content.read()
+                metadata_data, upload_data = self._upload_multipart(metadata_payload, file_content, content_type)
+            file_id = upload_data['id']
         
-        headers = {
-            "accept": "application/json",
-            "content-type": "application/json",
-            "authorization": f"Basic {encoded_token}"
+            # Return upload info
+            upload_info = {
+                'file_id': file_id,
+                'file_name': file_name,
+                'file_size': file_size,
+                'upload_success': True
+            }
+
+            data = { 'metadata_data': metadata_data, 'upload_data': upload_data }
+            
+            return upload_info, data
+            
+        except requests.exceptions.HTTPError as e:
+            # A 404 with a parent set usually means the cached folder was deleted
+            if folder_id and e.response is not None and e.response.status_code == 404:
+                folder_cache.invalidate_value(folder_id)
+            raise Exception(f"File upload failed: {str(e)}")
+        except (requests.exceptions.RequestException, KeyError, json.JSONDecodeError) as e:
+            raise Exception(f"File upload failed: {str(e)}") 
+
+    def _upload_multipart(self, metadata_payload, file_content, content_type):
+        body, multipart_type = build_multipart_body(metadata_payload, file_content, content_type)
+        upload_headers = {
+            "Content-Type": multipart_type
         }
-        
-        payload = {
-            "fileHandle": file_handle
+
+        def parse(upload_response):
+            upload_response.raise_for_status()
+            return upload_response.json()
+
+        def find():
+            return self.find_file(metadata_payload['name'], (metadata_payload.get('parents') or [None])[0],
+                                  metadata_payload.get('appProperties'))
+
+        upload_data = self.create(f"{self.upload_url}/files?uploadType=multipart", "drive.upload", find, parse,
+                                  headers=upload_headers, data=body)
+        return upload_data, upload_data
+
+    def _upload_resumable(self, metadata_payload, file_obj, content_type, file_size):
+        # Step 1: Open a resumable upload session with the metadata
+        session_headers = {
+            "X-Upload-Content-Type": content_type,
+            "X-Upload-Content-Length": str(file_size)
+        }
+        # Only opens a session, a second one that never gets content creates no file
+        session_response = self.request("POST", f"{self.upload_url}/files?uploadType=resumable", "drive.upload",
+                                        idempotent=True, headers=session_headers, json=metadata_payload)
+        session_response.raise_for_status()
+        session_url = session_response.headers['Location']
+        metadata_data = { 'session_url': session_url }
+
+        # Step 2: Send the content one chunk at a time
+        if file_size == 0:
+            upload_response = self.request("PUT", session_url, "drive.upload", headers={"Content-Range": "bytes */0"})
+            upload_response.raise_for_status()
+            return metadata_data, upload_response.json()
+
+        offset = 0
+        file_obj.seek(0)
+        while True:
+            chunk = file_obj.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                raise Exception(f"Upload stopped at byte {offset} of {file_size}")
+
+            chunk_headers = {
+                "Content-Type": content_type,
+                "Content-Range": f"bytes {offset}-{offset + len(chunk) - 1}/{file_size}"
+            }
+            upload_response = self.request("PUT", session_url, "drive.upload", headers=chunk_headers, data=chunk,
+                                           allow_redirects=False)
+
+            # 308 means Drive wants the next chunk, its Range header says how much it kept
+            if upload_response.status_code == 308:
+                received = upload_response.headers.get('Range')
+                offset = int(received.split('-')[-1]) + 1 if received else 0
+                file_obj.seek(offset)
+                continue
+
+            upload_response.raise_for_status()
+            return metadata_data, upload_response.json()
+
+    def get_account_id(self):
+        # Identifies the account across tokens, scopes the manifest's copy sources
+        return account_cache.get_or_load(self.google_token, self._fetch_account_id)
+
+    def _fetch_account_id(self):
+        try:
+            response = self.request("GET", f"{self.base_url}/about", "drive.about",
+                                    params={"fields": "user(permissionId)"})
+            response.raise_for_status()
+            return response.json()['user']['permissionId']
+        except (requests.exceptions.RequestException, KeyError, json.JSONDecodeError) as e:
+            raise Exception(f"Drive account lookup failed: {str(e)}")
+
+    def copy_file(self, source_file_id, file_name, folder_id=None, app_properties=None):
+        # Drive duplicates the bytes on its side, nothing is downloaded or uploaded.
+        # Returns (None, None) if the source file is not found for this account.
+        try:
+            copy_payload = {"name": file_name}
+            if folder_id:
+                copy_payload["parents"] = [folder_id]
+            if app_properties:
+                copy_payload["appProperties"] = app_properties
+
+            def parse(copy_response):
+                if copy_response.status_code == 404 and source_file_id in copy_response.text:
+                    # Drive names the missing file, a 404 for the target folder is an error
+                    return None
+                copy_response.raise_for_status()
+                return copy_response.json()
+
+            copy_data = self.create(f"{self.base_url}/files/{source_file_id}/copy", "drive.copy",
+                                    lambda: self.find_file(file_name, folder_id, app_properties), parse,
+                                    params={"fields": "id,name,size"}, json=copy_payload)
+            if copy_data is None:
+                return None, None
+
+            upload_info = {
+                'file_id': copy_data['id'],
+                'file_name': file_name,
+                'file_size': int(copy_data.get('size') or 0),
+                'upload_success': True,
+                'copied_from': source_file_id
+            }
+
+            return upload_info, copy_data
+
+        except requests.exceptions.HTTPError as e:
+            if folder_id and e.response is not None and e.response.status_code == 404:
+                # Either the source file or the cached folder is gone
+                folder_cache.invalidate_value(folder_id)
+            raise Exception(f"File copy failed: {str(e)}")
+        except (requests.exceptions.RequestException, KeyError, json.JSONDecodeError) as e:
+            raise Exception(f"File copy failed: {str(e)}")
+
+    def create_or_find_folder(self, folder_name):
+        return self.resolve_folders([folder_name])[folder_name]
+
+    def resolve_folders(self, folder_names):
+        try:
+            folder_ids = {}
+            missing = []
+            for folder_name in dict.fromkeys(folder_names):
+                folder_id = folder_cache.get((self.google_token, folder_name))
+                if folder_id is None:
+                    missing.append(folder_name)
+                else:
+                    folder_ids[folder_name] = folder_id
+
+            if not missing:
+                return folder_ids
+
+            # First, search for every uncached folder in as few queries as possible
+            found = self.find_folders(missing)
+            for folder_name, folder_id in found.items():
+                folder_cache.set((self.google_token, folder_name), folder_id)
+                folder_ids[folder_name] = folder_id
+
+            # Then create what is left, one creator per name so runs don't make duplicates
+            for folder_name in missing:
+                if folder_name in folder_ids:
+                    continue
+                with folder_cache.lock_for(folder_name):
+                    # Another thread may have created it while we waited
+                    folder_id = folder_cache.get((self.google_token, folder_name))
+                    if folder_id is None:
+                        folder_id = self._create_folder(folder_name)
+                        folder_cache.set((self.google_token, folder_name), folder_id)
+                folder_ids[folder_name] = folder_id
+
+            return folder_ids
+            
+        except (requests.exceptions.RequestException, KeyError, json.JSONDecodeError) as e:
+            raise Exception(f"Folder creation/search failed: {str(e)}")
+
+    def find_folders(self, folder_names):
+        # Resolve many folder names with one q query per batch, names not found are left out
+        folder_ids = {}
+        for start in range(0, len(folder_names), FOLDER_SEARCH_BATCH):
+            batch = folder_names[start:start + FOLDER_SEARCH_BATCH]
+            names_query = " or ".join(f"name={quote_query_value(folder_name)}" for folder_name in batch)
+            search_params = {
+                "q": f"({names_query}) and mimeType='{FOLDER_MIME_TYPE}' and trashed=false",
+                "fields": "nextPageToken, files(id, name)",
+                "pageSize": 1000
+            }
+
+            while True:
+                search_response = self.request("GET", f"{self.base_url}/files", "drive.folder", params=search_params)
+                search_response.raise_for_status()
+                search_data = search_response.json()
+
+                # Keep the first match per name, as the single-folder search did
+                for folder in search_data['files']:
+                    folder_ids.setdefault(folder['name'], folder['id'])
+
+                page_token = search_data.get('nextPageToken')
+                if not page_token:
+                    break
+                search_params['pageToken'] = page_token
+
+        return folder_ids
+
+    def list_folder_files(self, folder_id):
+        try:
+            list_params = {
+                "q": f"{quote_query_value(folder_id)} in parents and trashed=false",
+                "fields": "nextPageToken, files(id, name, size, appProperties)",
+                "pageSize": 1000
+            }
+
+            drive_files = []
+            while True:
+                list_response = self.request("GET", f"{self.base_url}/files", "drive.list", params=list_params)
+                list_response.raise_for_status()
+                list_data = list_response.json()
+                drive_files.extend(list_data['files'])
+
+                page_token = list_data.get('nextPageToken')
+                if not page_token:
+                    break
+                list_params['pageToken'] = page_token
+
+            return drive_files
+
+        except (requests.exceptions.RequestException, KeyError, json.JSONDecodeError) as e:
+            raise Exception(f"Folder listing failed: {str(e)}")
+
+    def _create_folder(self, folder_name):
+        create_payload = {
+            "name": folder_name,
+            "mimeType": FOLDER_MIME_TYPE
         }
         
-        response = requests.post(url, headers=headers, json=payload)
-        response.raise_for_status()
-        
-        data = response.json()
-        results = data['results']      
-        file_url = results['url']
-        file_info = { 'url': file_url }
-        
-        return file_info, data
-        
-    except (requests.exceptions.RequestException, KeyError, json.JSONDecodeError) as e:
-        raise Exception(f"API request failed: {str(e)}")
+        def parse(create_response):
+            create_response.raise_for_status()
+            return create_response.json()
+
+        def find():
+            folder_id = self.find_folders([folder_name]).get(folder_name)
+            return {'id': folder_id} if folder_id is not None else None
+
+        return self.create(f"{self.base_url}/files", "drive.folder", find, parse, json=create_payload)['id']
+
+# Clients are shared per token so every call in a run reuses the same pool
+_clients = {}
+_clients_lock = threading.Lock()
+_download_session = None
+
+def _get_client(client_class, token):
+    key = (client_class, token)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = client_class(token)
+            _clients[key] = client
+            # Drop the oldest client once too many tokens have been seen. It isn't
+            # closed, a run may still be using it, its pool goes once nothing refers to it.
+            if len(_clients) > MAX_CLIENTS:
+                _clients.pop(next(iter(_clients)))
+        return client
+
+def get_ashby_client(ashby_token):
+    return _get_client(AshbyClient, ashby_token)
+
+def get_drive_client(google_token):
+    return _get_client(DriveClient, google_token)
+
+def _get_download_session():
+    # Signed file URLs must not carry the Ashby or Google auth headers
+    global _download_session
+    with _clients_lock:
+        if _download_session is None:
+            _download_session = _build_session(POOL_SIZE)
+        return _download_session
+
+def fetch_jobs(ashby_token):
+    return get_ashby_client(ashby_token).fetch_jobs()
+
+def fetch_applications(ashby_token, filters):
+    return get_ashby_client(ashby_token).fetch_applications(filters)
+
+def iter_jobs(ashby_token, raw_pages=None):
+    return get_ashby_client(ashby_token).iter_jobs(raw_pages)
+
+def iter_applications(ashby_token, filters, raw_pages=None):
+    return get_ashby_client(ashby_token).iter_applications(filters, raw_pages)
+
+def fetch_candidate_info(ashby_token, candidate_id):
+    return get_ashby_client(ashby_token).fetch_candidate_info(candidate_id)
+
+def fetch_file_info(ashby_token, file_handle):
+    return get_ashby_client(ashby_token).fetch_file_info(file_handle)
+
+def download_file(file_url, stream=False):
+    if stream:
+        return _stream_download(file_url)
 
-def download_file(file_url):
     try:
-        response = requests.get(file_url)
+        response = rate_limiter.request(_get_download_session(), "GET", file_url, endpoint="download")
         response.raise_for_status()
         
         content = response.content
@@ -207,7 +687,8 @@ def download_file(file_url):
         file_data = {
             'content': content,
             'content_type': content_type,
-            'file_size': file_size
+            'file_size': file_size,
+            'sha256': hashlib.sha256(content).hexdigest()
         }
 
         return file_data
@@ -215,169 +696,405 @@ def download_file(file_url):
     except (requests.exceptions.RequestException, KeyError) as e:
         raise Exception(f"File download failed: {str(e)}") 
 
-def upload_file(google_token, file_name, file_data, folder_id=None):
+def _stream_download(file_url):
+    # Read the body in chunks into a spooled temp file so memory stays flat
+    # whatever the file size, the caller must close file_data['content']
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
     try:
-        file_content = file_data['content']
-        content_type = file_data['content_type']
-        file_size = file_data['file_size']
-        
-        # Step 1: Create file with metadata
-        metadata_url = "https://www.googleapis.com/drive/v3/files"
-        
-        metadata_headers = {
-            "Authorization": f"Bearer {google_token}",
-            "Content-Type": "application/json"
-        }
-        
-        metadata_payload = {
-            "name": file_name,
-            "mimeType": content_type
-        }
-        
-        # Add parent folder if specified
-        if folder_id:
-            metadata_payload["parents"] = [folder_id]
-        
-        metadata_response = requests.post(metadata_url, headers=metadata_headers, json=metadata_payload)
-        metadata_response.raise_for_status()
-        
-        metadata_data = metadata_response.json()
-        file_id = metadata_data['id']
-        
-        # Step 2: Upload the actual file content
-        upload_url = f"https://www.googleapis.com/upload/drive/v3/files/{file_id}?uploadType=media"
-        
-        upload_headers = {
-            "Authorization": f"Bearer {google_token}",
-            "Content-Type": content_type
-        }
-        
-        upload_response = requests.patch(upload_url, headers=upload_headers, data=file_content)
-        upload_response.raise_for_status()
-        
-        upload_data = upload_response.json()
-    
-        # Return upload info
-        upload_info = {
-            'file_id': file_id,
-            'file_name': file_name,
+        attempt = 0
+        while True:
+            with rate_limiter.request(_get_download_session(), "GET", file_url, endpoint="download", stream=True) as response:
+                response.raise_for_status()
+                content_type = response.headers['content-type']
+
+                spool.seek(0)
+                spool.truncate()
+                file_size = 0
+                # Hashed on the way through, so identical resumes can be copied in Drive
+                digest = hashlib.sha256()
+                try:
+                    for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                        spool.write(chunk)
+                        digest.update(chunk)
+                        file_size += len(chunk)
+                except rate_limiter.DROPPED_CONNECTION_ERRORS as e:
+                    # rate_limiter.request returned with the headers, a connection dropped
+                    # mid-body is retried here, starting the file over
+                    if attempt >= rate_limiter.MAX_RETRIES:
+                        raise
+                    reason = str(e)
+                else:
+                    break
+
+            metrics.api_retries.inc(endpoint="download")
+            delay = rate_limiter.backoff_delay(attempt)
+            web_logger.WARNING("Retrying download in %.1fs after %s at byte %d (attempt %d)", delay, reason, file_size,
+                               attempt + 1)
+            time.sleep(delay)
+            attempt += 1
+
+        spool.seek(0)
+        file_data = {
+            'content': spool,
+            'content_type': content_type,
             'file_size': file_size,
-            'upload_success': True
+            'sha256': digest.hexdigest()
         }
 
-        data = { 'metadata_data': metadata_data, 'upload_data': upload_data }
-        
-        return upload_info, data
-        
-    except (requests.exceptions.RequestException, KeyError, json.JSONDecodeError) as e:
-        raise Exception(f"File upload failed: {str(e)}") 
+        return file_data
+
+    except (requests.exceptions.RequestException, KeyError) as e:
+        spool.close()
+        raise Exception(f"File download failed: {str(e)}")
+
+def upload_file(google_token, file_name, file_data, folder_id=None, app_properties=None):
+    return get_drive_client(google_token).upload_file(file_name, file_data, folder_id, app_properties)
+
+def copy_file(google_token, source_file_id, file_name, folder_id=None, app_properties=None):
+    return get_drive_client(google_token).copy_file(source_file_id, file_name, folder_id, app_properties)
+
+def get_account_id(google_token):
+    return get_drive_client(google_token).get_account_id()
+
+def list_folder_files(google_token, folder_id):
+    return get_drive_client(google_token).list_folder_files(folder_id)
 
 def create_or_find_folder(google_token, folder_name):
-    try:
-        # First, search for existing folder
-        search_url = "https://www.googleapis.com/drive/v3/files"
-        search_headers = {
-            "Authorization": f"Bearer {google_token}"
-        }
-        search_params = {
-            "q": f"name='{folder_name}' and mimeType='application/vnd.google-apps.folder' and trashed=false",
-            "fields": "files(id, name)"
-        }
-        
-        search_response = requests.get(search_url, headers=search_headers, params=search_params)
-        search_response.raise_for_status()
-        search_data = search_response.json()
-        
-        # If folder exists, return its ID
-        if search_data['files']:
-            folder_id = search_data['files'][0]['id']
-            return folder_id
-        
-        # If folder doesn't exist, create it
-        create_url = "https://www.googleapis.com/drive/v3/files"
-        create_headers = {
-            "Authorization": f"Bearer {google_token}",
-            "Content-Type": "application/json"
-        }
-        create_payload = {
-            "name": folder_name,
-            "mimeType": "application/vnd.google-apps.folder"
-        }
-        
-        create_response = requests.post(create_url, headers=create_headers, json=create_payload)
-        create_response.raise_for_status()
-        create_data = create_response.json()
-        folder_id = create_data['id']
-        
-        return folder_id
-        
-    except (requests.exceptions.RequestException, KeyError, json.JSONDecodeError) as e:
-        raise Exception(f"Folder creation/search failed: {str(e)}")
+    return get_drive_client(google_token).create_or_find_folder(folder_name)
+
+def resolve_folders(google_token, folder_names):
+    return get_drive_client(google_token).resolve_folders(folder_names)
+
+def invalidate_folder_cache(google_token=None, folder_name=None):
+    # With no folder given the whole cache is dropped
+    if google_token is None or folder_name is None:
+        folder_cache.invalidate()
+    else:
+        folder_cache.invalidate((google_token, folder_name))
    
-def filter_candidates(ashby_token, candidates):
-    filtered_candidates = []
+def parse_timestamp(value):
+    # Ashby timestamps look like 2025-02-14T13:09:54.808Z
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+    except (AttributeError, ValueError):
+        return None
 
+def lookup_candidate_info(ashby_token, candidate, info_cache=None):
+    # candidate.info answers with the candidate's current ID, which differs from the
+    # listed one once candidates were merged in Ashby. 'listed_id' keeps the latter.
+    with tracing.span('candidate.info', candidate_id=candidate['id']) as lookup_span:
+        # A cached lookup is still good if it was made after the application last changed
+        if info_cache is not None:
+            updated_at = parse_timestamp(candidate.get('updated_at'))
+            cached = info_cache.get(candidate['id']) if updated_at is not None else None
+            if cached is not None and cached[1] > updated_at:
+                lookup_span.set(cached=True)
+                return dict(cached[0], listed_id=candidate['id'])
 
-    for candidate in candidates:
         candidate_info, data = fetch_candidate_info(ashby_token, candidate['id'])
+        if info_cache is not None:
+            info_cache.set(candidate['id'], candidate_info)
+        return dict(candidate_info, listed_id=candidate['id'])
+
+def filter_candidates(ashby_token, candidates, max_workers=CANDIDATE_INFO_WORKERS, errors=None, on_result=None, info_cache=None):
+    filtered_candidates = []
+
+    def lookup(task):
+        task['candidate_info'] = lookup_candidate_info(ashby_token, task['candidate'], info_cache)
+        return task
+
+    # Progress hook, called as each lookup finishes
+    def finish(task, error):
+        if on_result is not None:
+            on_result(task['candidate'], task.get('candidate_info'), error)
+
+    # Lookups fan out over a bounded worker pool and start on the first candidates
+    # while a paginated iterator may still be loading the next page
+    stages = [Stage('candidate_info', lookup, max_workers)]
+    tasks = ({'candidate': candidate} for candidate in candidates)
+    outcomes = run_pipeline(tasks, stages, PIPELINE_QUEUE_SIZE, on_result=finish)
+
+    for task, error in outcomes:
+        candidate = task['candidate']
+        if error is not None:
+            web_logger.WARNING("Candidate info failed for %s: %s", candidate['id'], error)
+            if errors is not None:
+                errors.append({
+                    'candidate_name': candidate.get('name'),
+                    'candidate_id': candidate['id'],
+                    'error': error
+                })
+            continue
+
+        candidate_info = task['candidate_info']
         if candidate_info.get('resume_file_handle') is not None:
             filtered_candidates.append(candidate_info)
     
     return filtered_candidates
 
-def add_resumes(ashby_token, google_token, filtered_candidates, folder_name):
-    results = []
-    
+def iter_resume_files(ashby_token, candidates, info_cache=None):
+    # Looks up, fetches and downloads every candidate's resume, yielding one result
+    # per candidate in the order the downloads finish. result['file_data'] is None
+    # for a candidate with no resume or on error, otherwise its spooled content must
+    # be closed by the caller. Only PIPELINE_QUEUE_SIZE downloads wait on a slow
+    # consumer before the workers pause, and closing the generator early stops them.
+    def lookup_stage(task):
+        task['candidate_info'] = lookup_candidate_info(ashby_token, task['candidate'], info_cache)
+        return task
+
+    def fetch_stage(task):
+        file_handle = task['candidate_info'].get('resume_file_handle')
+        if file_handle:
+            with tracing.span('file.info', candidate_id=task['candidate']['id']):
+                task['file_info'], raw_file_data = fetch_file_info(ashby_token, file_handle)
+        return task
+
+    def download_stage(task):
+        if task.get('file_info') is not None:
+            with tracing.span('download', candidate_id=task['candidate']['id']) as download_span:
+                task['file_data'] = download_file(task['file_info']['url'], stream=True)
+                download_span.set(bytes=task['file_data']['file_size'])
+        return task
+
+    def discard(task):
+        if task.get('file_data') is not None:
+            task['file_data']['content'].close()
+
+    stages = [
+        Stage('candidate_info', lookup_stage, CANDIDATE_INFO_WORKERS),
+        Stage('file_info', fetch_stage, FILE_INFO_WORKERS),
+        Stage('download', download_stage, DOWNLOAD_WORKERS)
+    ]
+    tasks = ({'candidate': candidate} for candidate in candidates)
+
+    for task, error in iter_pipeline(tasks, stages, PIPELINE_QUEUE_SIZE, discard=discard):
+        candidate = task.get('candidate_info') or task['candidate']
+        if error is not None:
+            web_logger.WARNING("Resume fetch failed for %s: %s", candidate['id'], error)
+            discard(task)
+        yield {
+            'candidate_name': candidate.get('name'),
+            'candidate_id': candidate['id'],
+            'listed_id': task['candidate']['id'],
+            'file_name': resume_file_name(candidate) if error is None and task.get('file_data') else None,
+            'file_data': task.get('file_data') if error is None else None,
+            'error': error
+        }
+
+def resume_folder_names(folder_name, candidate_folders=None):
+    # Every folder an add_resumes call may upload into, in first-seen order
+    folder_names = [folder_name] if folder_name else []
+    for names in (candidate_folders or {}).values():
+        folder_names.extend(names)
+    return list(dict.fromkeys(folder_names))
+
+def add_resumes(ashby_token, google_token, filtered_candidates, folder_name, manifest=None, on_result=None, run_id=None,
+                candidate_folders=None):
+    # Each resume goes to folder_name, or to every folder candidate_folders lists for
+    # the candidate's ID. It is downloaded once however many folders it goes to, and
+    # there is one result per candidate and folder. A resume Drive already holds in
+    # another folder, from this run or an earlier one, is copied there by Drive
+    # instead of being downloaded and uploaded again.
     try:
-        folder_id = create_or_find_folder(google_token, folder_name)
+        folder_ids = resolve_folders(google_token, resume_folder_names(folder_name, candidate_folders))
     except Exception as e:
-        folder_id = None
-    
-    for candidate in filtered_candidates:
-        candidate_name = candidate.get('name')
-        candidate_id = candidate.get('id')
+        folder_ids = {}
+
+    # Copy sources are only looked up among the files of the token's own Drive account
+    account_id = None
+    if manifest is not None:
+        try:
+            account_id = get_account_id(google_token)
+        except Exception as e:
+            web_logger.WARNING("Copying in Drive disabled for this run: %s", e)
+
+    # Bring the manifest in line with what the Drive folders hold right now
+    if manifest is not None:
+        for folder_id in dict.fromkeys(folder_ids.values()):
+            try:
+                seeded = manifest.seed_folder(folder_id, list_folder_files(google_token, folder_id), account_id)
+                web_logger.INFO(f"Manifest seeded with {seeded} exported resumes for folder {folder_id}")
+            except Exception as e:
+                web_logger.WARNING("Manifest seeding failed, using local manifest: %s", e)
+
+    def pending(task):
+        return [target for target in task['targets'] if 'upload_info' not in target and 'error' not in target]
+
+    # Step 1: Fetch file info from Ashby, unless this resume is already in every folder
+    def fetch_stage(task):
+        candidate = task['candidate']
+        file_handle = candidate.get('resume_file_handle')
+        if not file_handle:
+            raise Exception('No resume file handle found')
+        if manifest is not None:
+            for target in task['targets']:
+                if target['folder_id']:
+                    exported = manifest.get(candidate.get('id'), file_handle, target['folder_id'],
+                                            resume_file_name(candidate))
+                    if exported is not None:
+                        target['upload_info'] = exported
+        if not pending(task):
+            return task
+        if manifest is not None:
+            task['copy_source'] = manifest.find_copy(file_handle, account_id)
+            if task['copy_source'] is not None:
+                return task
+        fetch_file(task)
+        return task
+
+    def fetch_file(task):
+        candidate = task['candidate']
+        started = time.monotonic()
+        with tracing.span('file.info', candidate_id=candidate.get('id')):
+            file_info, raw_file_data = fetch_file_info(ashby_token, candidate.get('resume_file_handle'))
+        task['file_info'] = file_info
+        if events.has_subscribers(run_id):
+            events.publish(run_id, 'file_info', candidate_id=candidate.get('id'),
+                           candidate_name=candidate.get('name'), seconds=time.monotonic() - started)
+
+    # Step 2: Stream file from URL into a spooled temp file
+    def download_stage(task):
+        if not pending(task) or task.get('copy_source') is not None:
+            return task
+        download(task)
+        return task
+
+    def download(task):
+        started = time.monotonic()
+        with tracing.span('download', candidate_id=task['candidate'].get('id')) as download_span:
+            task['file_data'] = download_file(task['file_info']['url'], stream=True)
+            download_span.set(bytes=task['file_data']['file_size'])
+        if events.has_subscribers(run_id):
+            candidate = task['candidate']
+            events.publish(run_id, 'downloaded', candidate_id=candidate.get('id'), candidate_name=candidate.get('name'),
+                           bytes=task['file_data']['file_size'], seconds=time.monotonic() - started)
+
+    def send(task, target):
+        candidate = task['candidate']
         file_handle = candidate.get('resume_file_handle')
-        result = {
-            'candidate_name': candidate_name,
-            'candidate_id': candidate_id,
-            'file_info': None,
-            'upload_info': None,
-            'error': None
+        file_name = resume_file_name(candidate)
+        app_properties = {
+            'ashbyCandidateId': candidate.get('id'),
+            'ashbyFileHash': handle_digest(file_handle)
         }
-        
-        
+        file_data = task.get('file_data')
+        if file_data is not None:
+            app_properties['ashbyContentHash'] = file_data['sha256']
+
+        # A different file handle can still hold the same bytes, e.g. a resume re-attached to a new application
+        source = task.get('copy_source')
+        if source is None and file_data is not None and manifest is not None:
+            source = manifest.find_content(file_data['sha256'], account_id)
+
+        if source is not None:
+            try:
+                with tracing.span('copy', candidate_id=candidate.get('id'), folder_name=target['folder_name'],
+                                  source=source['file_id']):
+                    upload_info, copy_data = copy_file(google_token, source['file_id'], file_name,
+                                                       target['folder_id'], app_properties)
+            except Exception as e:
+                # Throttling that outlasted the retries, permissions and the like, the
+                # source itself may be fine so the manifest keeps it
+                web_logger.WARNING("Copy of %s failed, uploading instead: %s", source['file_id'], e)
+                upload_info = None
+            else:
+                if upload_info is None:
+                    web_logger.WARNING("Copy source %s is gone from Drive, uploading instead", source['file_id'])
+                    if manifest is not None:
+                        manifest.forget_file(source['file_id'], account_id)
+            if upload_info is not None:
+                return upload_info
+            task['copy_source'] = None
+
+        if task.get('file_data') is None:
+            if task.get('file_info') is None:
+                fetch_file(task)
+            download(task)
+            app_properties['ashbyContentHash'] = task['file_data']['sha256']
+
+        with tracing.span('upload', candidate_id=candidate.get('id'), folder_name=target['folder_name'],
+                          bytes=task['file_data']['file_size']):
+            upload_info, upload_metadata = upload_file(google_token, file_name, task['file_data'],
+                                                       target['folder_id'], app_properties)
+        if manifest is not None:
+            manifest.record_content(task['file_data']['sha256'], upload_info, account_id)
+        return upload_info
+
+    # Step 3: Upload to Google Drive, once per folder that doesn't have it yet
+    def upload_stage(task):
+        targets = pending(task)
+        if not targets:
+            return task
+        candidate = task['candidate']
+        file_handle = candidate.get('resume_file_handle')
         try:
-            # Skip candidates without file handle
-            if not file_handle:
-                result['error'] = 'No resume file handle found'
-                results.append(result)
-                continue
-            
-            # Step 1: Fetch file info from Ashby
-            file_info, raw_file_data = fetch_file_info(ashby_token, file_handle)
-            file_url = file_info['url']
-            
-            # Step 2: Download file from URL
-            file_data = download_file(file_url)
-            
-            # Step 3: Create appropriate filename
-            file_name = f"{candidate_name.replace(' ', '_')}_{candidate_id}_resume.pdf"
-            
-            # Step 4: Upload to Google Drive (in the specified folder)
-            upload_info, upload_metadata = upload_file(google_token, file_name, file_data, folder_id)
+            for target in targets:
+                started = time.monotonic()
+                try:
+                    upload_info = send(task, target)
+                except Exception as e:
+                    # One folder failing doesn't stop the others
+                    target['error'] = str(e)
+                    continue
+                target['upload_info'] = upload_info
+                # Any further folders get a Drive-side copy of this file
+                task['copy_source'] = upload_info
+                if events.has_subscribers(run_id):
+                    event_type = 'copied' if upload_info.get('copied_from') else 'uploaded'
+                    events.publish(run_id, event_type, candidate_id=candidate.get('id'), candidate_name=candidate.get('name'),
+                                   folder_name=target['folder_name'], bytes=upload_info['file_size'],
+                                   seconds=time.monotonic() - started)
+                if manifest is not None and target['folder_id']:
+                    manifest.record(candidate.get('id'), file_handle, target['folder_id'], upload_info, account_id)
+        finally:
+            # Release the temp file as soon as it has been sent everywhere
+            if task.get('file_data') is not None:
+                task['file_data']['content'].close()
+                task['file_data'] = None
+        return task
+
+    stages = [
+        Stage('file_info', fetch_stage, FILE_INFO_WORKERS),
+        Stage('download', download_stage, DOWNLOAD_WORKERS),
+        Stage('upload', upload_stage, UPLOAD_WORKERS)
+    ]
+
+    def new_task(candidate):
+        names = (candidate_folders or {}).get(candidate.get('id')) or [folder_name]
+        targets = [{'folder_name': name, 'folder_id': folder_ids.get(name)} for name in names]
+        return {'candidate': candidate, 'targets': targets}
+
+    tasks = (new_task(candidate) for candidate in filtered_candidates)
 
+    def finish(task, error):
+        candidate = task['candidate']
+        task['results'] = []
+        for target in task['targets']:
             result = {
-                'candidate_name': candidate_name,
-                'candidate_id': candidate_id,
-                'file_info': file_info,
-                'upload_info': upload_info,
-                'error': None
+                'candidate_name': candidate.get('name'),
+                'candidate_id': candidate.get('id'),
+                'folder_name': target['folder_name'],
+                'file_info': None,
+                'upload_info': None,
+                'error': error or target.get('error')
             }
-            web_logger.INFO(f"Result: {result}")
-        except Exception as e:
-            result['error'] = str(e)
-        
-        results.append(result)
-    
-    return results 
+            if result['error'] is None:
+                result['file_info'] = task.get('file_info')
+                result['upload_info'] = target['upload_info']
+                web_logger.DEBUG("Result: %s", result)
+            task['results'].append(result)
+            if events.has_subscribers(run_id):
+                if result['error'] is not None:
+                    events.publish(run_id, 'failed', candidate_id=result['candidate_id'],
+                                   candidate_name=result['candidate_name'], folder_name=target['folder_name'],
+                                   error=result['error'])
+                elif result['upload_info'].get('skipped'):
+                    events.publish(run_id, 'skipped', candidate_id=result['candidate_id'],
+                                   candidate_name=result['candidate_name'], folder_name=target['folder_name'])
+            if on_result is not None:
+                on_result(result)
+
+    outcomes = run_pipeline(tasks, stages, PIPELINE_QUEUE_SIZE, on_result=finish)
+    results = [result for task, error in outcomes for result in task['results']]
 
+    return results
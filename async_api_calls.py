@@ -0,0 +1,979 @@
+import asyncio
+import atexit
+import base64
+import concurrent.futures
+import hashlib
+import io
+import json
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlsplit
+import aiohttp
+import web_logger
+import events
+import metrics
+import tracing
+from api_calls import (
+    ASHBY_BASE_URL, DRIVE_BASE_URL, DRIVE_UPLOAD_URL, DOWNLOAD_CHUNK_SIZE, SPOOL_MAX_SIZE, PIPELINE_QUEUE_SIZE,
+    UPLOAD_CHUNK_SIZE, RESUMABLE_THRESHOLD, FOLDER_MIME_TYPE, CONNECT_TIMEOUT, READ_TIMEOUT, folder_cache, account_cache, quote_query_value,
+    parse_job, parse_application, parse_candidate_info, parse_file_info, build_multipart_body,
+    resume_file_name, resume_folder_names, parse_timestamp
+)
+from manifest import handle_digest
+from rate_limiter import (
+    MAX_RETRIES, RETRY_STATUS_CODES, THROTTLED_REASON, get_limiter, is_idempotent, retry_after_seconds, backoff_delay
+)
+
+# Connections in the shared pool, across every host
+POOL_LIMIT = 100
+POOL_LIMIT_PER_HOST = 50
+
+# Concurrent coroutines allowed in each step, these are cheap compared to threads.
+# Requests still go through rate_limiter's per-host limits, shared with api_calls.
+CANDIDATE_INFO_CONCURRENCY = 32
+FILE_INFO_CONCURRENCY = 16
+DOWNLOAD_CONCURRENCY = 64
+UPLOAD_CONCURRENCY = 16
+
+# Resumes fetched and not yet uploaded everywhere, however many candidates are
+# gathered at once. The same bound the sync pipeline's upload queue and workers
+# put on them, so slow uploads hold back the downloads instead of piling up files.
+SPOOLED_FILES_LIMIT = UPLOAD_CONCURRENCY + PIPELINE_QUEUE_SIZE
+
+REQUEST_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError, KeyError, json.JSONDecodeError)
+
+# A response body cut short, like rate_limiter.DROPPED_CONNECTION_ERRORS for requests
+DROPPED_BODY_ERRORS = (aiohttp.ClientPayloadError, aiohttp.ClientConnectionError, asyncio.TimeoutError)
+
+# One aiohttp session per event loop, sessions cannot be shared between loops
+_sessions = {}
+
+async def _get_session():
+    loop = asyncio.get_running_loop()
+    session = _sessions.get(loop)
+    if session is None or session.closed:
+        connector = aiohttp.TCPConnector(limit=POOL_LIMIT, limit_per_host=POOL_LIMIT_PER_HOST)
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=CONNECT_TIMEOUT, sock_read=READ_TIMEOUT)
+        session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        _sessions[loop] = session
+    return session
+
+async def close_session():
+    # Close the running loop's session, call this before the loop shuts down
+    session = _sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None:
+        await session.close()
+
+async def _request(method, url, endpoint, idempotent=None, **kwargs):
+    # Same limiter and retry policy as rate_limiter.request: the host's slots, token
+    # bucket and AIMD state are shared with the threads calling it, and 429s, Drive's
+    # throttling 403s, 5xxs and dropped connections are retried. Requests that aren't
+    # idempotent only when they were throttled.
+    session = await _get_session()
+    host = urlsplit(url).hostname
+    limiter = get_limiter(host)
+    retry_unknown = is_idempotent(method, idempotent)
+    data = kwargs.get('data')
+    sent_bytes = len(data) if isinstance(data, (bytes, bytearray)) else 0
+    attempt = 0
+    while True:
+        with tracing.span('limiter.wait', 'http', host=host):
+            await limiter.acquire_async()
+        started = time.monotonic()
+        # Status the slot is released with, None counts as a dropped connection
+        status = None
+        try:
+            with tracing.span(f"HTTP {endpoint}", 'http', method=method, attempt=attempt) as http_span:
+                response = await session.request(method, url, **kwargs)
+                http_span.set(status=response.status)
+            # Timed until the response headers, the body size comes from Content-Length
+            metrics.observe_api_call(endpoint, response.status, time.monotonic() - started,
+                                     sent_bytes, response.content_length or 0)
+            throttled = response.status == 429
+            if response.status == 403:
+                # Drive reports quota exhaustion as a 403 with a rateLimitExceeded reason,
+                # the body stays cached on the response for the caller
+                throttled = THROTTLED_REASON in (await response.text()).lower()
+            status = 429 if throttled else response.status
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+            metrics.observe_api_call(endpoint, 'error', time.monotonic() - started)
+            if attempt >= MAX_RETRIES or not retry_unknown:
+                raise
+            delay = backoff_delay(attempt)
+            reason = str(e) or type(e).__name__
+        else:
+            retry = throttled or (retry_unknown and response.status in RETRY_STATUS_CODES)
+            if not retry or attempt >= MAX_RETRIES:
+                return response
+            delay = retry_after_seconds(response)
+            if delay is None:
+                delay = backoff_delay(attempt)
+            if throttled:
+                limiter.pause(delay)
+            reason = f"HTTP {response.status}"
+            response.release()
+        finally:
+            limiter.release(status)
+
+        metrics.api_retries.inc(endpoint=endpoint)
+        web_logger.WARNING("Retrying %s %s in %.1fs after %s (attempt %d)", method, urlsplit(url).path, delay, reason, attempt + 1)
+        with tracing.span('backoff', 'http', endpoint=endpoint, reason=reason):
+            await asyncio.sleep(delay)
+        attempt += 1
+
+def _ashby_headers(ashby_token):
+    encoded_token = base64.b64encode(f"{ashby_token}:".encode()).decode()
+    return {
+        "accept": "application/json",
+        "content-type": "application/json",
+        "authorization": f"Basic {encoded_token}"
+    }
+
+def _drive_headers(google_token, extra_headers=None):
+    headers = {"Authorization": f"Bearer {google_token}"}
+    headers.update(extra_headers or {})
+    return headers
+
+async def _ashby_post(ashby_token, endpoint, payload=None):
+    response = await _request("POST", f"{ASHBY_BASE_URL}/{endpoint}", endpoint, idempotent=True, json=payload,
+                              headers=_ashby_headers(ashby_token))
+    async with response:
+        response.raise_for_status()
+        return await response.json(content_type=None)
+
+async def _iter_pages(ashby_token, endpoint, payload=None):
+    cursor = None
+    while True:
+        # Prepare payload with filters and cursor
+        page_payload = dict(payload or {})
+        if cursor:
+            page_payload['cursor'] = cursor
+
+        with tracing.span(endpoint, 'ashby', cursor=cursor) as page_span:
+            data = await _ashby_post(ashby_token, endpoint, page_payload if page_payload else None)
+            page_span.set(results=len(data.get('results', [])))
+        yield data
+
+        # Check if more data is available
+        if not data.get('moreDataAvailable', False):
+            break
+
+        cursor = data.get('nextCursor')
+        if not cursor:
+            break
+
+async def iter_jobs(ashby_token, raw_pages=None):
+    try:
+        async for data in _iter_pages(ashby_token, "job.list"):
+            if raw_pages is not None:
+                raw_pages.append(data)
+            for job in data['results']:
+                yield parse_job(job)
+
+    except REQUEST_ERRORS as e:
+        raise Exception(f"API request failed: {str(e)}")
+
+async def iter_applications(ashby_token, filters, raw_pages=None):
+    try:
+        async for data in _iter_pages(ashby_token, "application.list", filters):
+            if raw_pages is not None:
+                raw_pages.append(data)
+            for application in data['results']:
+                yield parse_application(application)
+
+    except REQUEST_ERRORS as e:
+        raise Exception(f"API request failed: {str(e)}")
+
+async def fetch_jobs(ashby_token):
+    all_raw_data = []
+    all_jobs = [job async for job in iter_jobs(ashby_token, raw_pages=all_raw_data)]
+    web_logger.INFO(f"Total jobs fetched: {len(all_jobs)}")
+    return all_jobs, all_raw_data
+
+async def fetch_applications(ashby_token, filters):
+    all_raw_data = []
+    all_candidates = [candidate async for candidate in iter_applications(ashby_token, filters, raw_pages=all_raw_data)]
+    web_logger.INFO(f"Total applications fetched: {len(all_candidates)}")
+    return all_candidates, all_raw_data
+
+async def fetch_candidate_info(ashby_token, candidate_id):
+    try:
+        data = await _ashby_post(ashby_token, "candidate.info", {"id": candidate_id})
+        return parse_candidate_info(data), data
+
+    except REQUEST_ERRORS as e:
+        raise Exception(f"API request failed: {str(e)}")
+
+async def fetch_file_info(ashby_token, file_handle):
+    try:
+        data = await _ashby_post(ashby_token, "file.info", {"fileHandle": file_handle})
+        return parse_file_info(data), data
+
+    except REQUEST_ERRORS as e:
+        raise Exception(f"API request failed: {str(e)}")
+
+async def download_file(file_url, stream=False):
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE) if stream else None
+    try:
+        attempt = 0
+        while True:
+            response = await _request("GET", file_url, "download")
+            async with response:
+                response.raise_for_status()
+                content_type = response.headers['content-type']
+
+                file_size = 0
+                digest = hashlib.sha256()
+                try:
+                    if not stream:
+                        content = await response.read()
+                        return {
+                            'content': content,
+                            'content_type': content_type,
+                            'file_size': len(content),
+                            'sha256': hashlib.sha256(content).hexdigest()
+                        }
+
+                    # Spool the body chunk by chunk so memory stays flat, the caller closes it
+                    spool.seek(0)
+                    spool.truncate()
+                    async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                        spool.write(chunk)
+                        digest.update(chunk)
+                        file_size += len(chunk)
+                except DROPPED_BODY_ERRORS as e:
+                    # _request returned with the headers, a connection dropped mid-body
+                    # is retried here, starting the file over
+                    if attempt >= MAX_RETRIES:
+                        raise
+                    reason = str(e) or type(e).__name__
+                else:
+                    break
+
+            metrics.api_retries.inc(endpoint="download")
+            delay = backoff_delay(attempt)
+            web_logger.WARNING("Retrying download in %.1fs after %s at byte %d (attempt %d)", delay, reason, file_size,
+                               attempt + 1)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+        spool.seek(0)
+        return {
+            'content': spool,
+            'content_type': content_type,
+            'file_size': file_size,
+            'sha256': digest.hexdigest()
+        }
+
+    except (aiohttp.ClientError, asyncio.TimeoutError, KeyError) as e:
+        if spool is not None:
+            spool.close()
+        raise Exception(f"File download failed: {str(e)}")
+
+async def upload_file(google_token, file_name, file_data, folder_id=None, app_properties=None):
+    try:
+        file_content = file_data['content']
+        content_type = file_data['content_type']
+        file_size = file_data['file_size']
+
+        metadata_payload = {
+            "name": file_name,
+            "mimeType": content_type
+        }
+        if folder_id:
+            metadata_payload["parents"] = [folder_id]
+        if app_properties:
+            metadata_payload["appProperties"] = app_properties
+
+        # Small files go up with their metadata in one request, large ones in chunks
+        if file_size > RESUMABLE_THRESHOLD:
+            if not hasattr(file_content, 'read'):
+                file_content = io.BytesIO(file_content)
+            metadata_data, upload_data = await _upload_resumable(google_token, metadata_payload, file_content, content_type, file_size)
+        else:
+            if hasattr(file_content, 'read'):
+                file_content.seek(0)
+                file_content = file_content.read()
+            body, multipart_type = build_multipart_body(metadata_payload, file_content, content_type)
+
+            async def parse(response):
+                response.raise_for_status()
+                return await response.json(content_type=None)
+
+            upload_data = await _create(f"{DRIVE_UPLOAD_URL}/files?uploadType=multipart", "drive.upload",
+                                        lambda: find_file(google_token, file_name, folder_id, app_properties), parse,
+                                        data=body, headers=_drive_headers(google_token, {"Content-Type": multipart_type}))
+            metadata_data = upload_data
+
+        upload_info = {
+            'file_id': upload_data['id'],
+            'file_name': file_name,
+            'file_size': file_size,
+            'upload_success': True
+        }
+
+        data = { 'metadata_data': metadata_data, 'upload_data': upload_data }
+
+        return upload_info, data
+
+    except REQUEST_ERRORS as e:
+        raise Exception(f"File upload failed: {str(e)}")
+
+async def _create(url, endpoint, find, parse, **kwargs):
+    # Same as api_calls.DriveClient.create: a POST that creates a file or folder is
+    # only sent again after a 5xx or a dropped connection if find() can't see its result
+    attempt = 0
+    while True:
+        try:
+            response = await _request("POST", url, endpoint, **kwargs)
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+            if attempt >= MAX_RETRIES:
+                raise
+            reason = str(e) or type(e).__name__
+        else:
+            async with response:
+                if response.status not in RETRY_STATUS_CODES or attempt >= MAX_RETRIES:
+                    return await parse(response)
+            reason = f"HTTP {response.status}"
+
+        existing = await find()
+        if existing is not None:
+            web_logger.WARNING("%s went through despite %s, using %s", endpoint, reason, existing['id'])
+            return existing
+        metrics.api_retries.inc(endpoint=endpoint)
+        delay = backoff_delay(attempt)
+        web_logger.WARNING("Retrying POST %s in %.1fs after %s (attempt %d)", endpoint, delay, reason, attempt + 1)
+        await asyncio.sleep(delay)
+        attempt += 1
+
+async def _find_files(google_token, terms):
+    search_params = {
+        "q": " and ".join(terms + ["trashed=false"]),
+        "fields": "files(id, name, size, appProperties)",
+        "pageSize": "100"
+    }
+    response = await _request("GET", f"{DRIVE_BASE_URL}/files", "drive.find", params=search_params,
+                              headers=_drive_headers(google_token))
+    async with response:
+        response.raise_for_status()
+        return (await response.json(content_type=None))['files']
+
+async def find_file(google_token, file_name, folder_id=None, app_properties=None):
+    # Same as api_calls.DriveClient.find_file
+    terms = [f"name={quote_query_value(file_name)}"]
+    if folder_id:
+        terms.append(f"{quote_query_value(folder_id)} in parents")
+    for drive_file in await _find_files(google_token, terms):
+        properties = drive_file.get('appProperties') or {}
+        if all(properties.get(key) == value for key, value in (app_properties or {}).items()):
+            return drive_file
+    return None
+
+async def get_account_id(google_token):
+    # The Drive permissionId of the token's user, shares api_calls.account_cache
+    account_id = account_cache.get(google_token)
+    if account_id is not None:
+        return account_id
+    try:
+        response = await _request("GET", f"{DRIVE_BASE_URL}/about", "drive.about",
+                                  params={"fields": "user(permissionId)"}, headers=_drive_headers(google_token))
+        async with response:
+            response.raise_for_status()
+            data = await response.json(content_type=None)
+        account_id = data['user']['permissionId']
+    except REQUEST_ERRORS as e:
+        raise Exception(f"Drive account lookup failed: {str(e)}")
+    account_cache.set(google_token, account_id)
+    return account_id
+
+async def copy_file(google_token, source_file_id, file_name, folder_id=None, app_properties=None):
+    # Drive duplicates the bytes on its side, nothing is downloaded or uploaded.
+    # Returns (None, None) if the source file is not found for this account.
+    try:
+        copy_payload = {"name": file_name}
+        if folder_id:
+            copy_payload["parents"] = [folder_id]
+        if app_properties:
+            copy_payload["appProperties"] = app_properties
+
+        async def parse(response):
+            if response.status == 404 and source_file_id in await response.text():
+                # Drive names the missing file, a 404 for the target folder is an error
+                return None
+            response.raise_for_status()
+            return await response.json(content_type=None)
+
+        copy_data = await _create(f"{DRIVE_BASE_URL}/files/{source_file_id}/copy", "drive.copy",
+                                  lambda: find_file(google_token, file_name, folder_id, app_properties), parse,
+                                  params={"fields": "id,name,size"}, json=copy_payload,
+                                  headers=_drive_headers(google_token))
+        if copy_data is None:
+            return None, None
+
+        upload_info = {
+            'file_id': copy_data['id'],
+            'file_name': file_name,
+            'file_size': int(copy_data.get('size') or 0),
+            'upload_success': True,
+            'copied_from': source_file_id
+        }
+
+        return upload_info, copy_data
+
+    except REQUEST_ERRORS as e:
+        raise Exception(f"File copy failed: {str(e)}")
+
+async def _upload_resumable(google_token, metadata_payload, file_obj, content_type, file_size):
+    session_headers = _drive_headers(google_token, {
+        "X-Upload-Content-Type": content_type,
+        "X-Upload-Content-Length": str(file_size)
+    })
+    # Only opens a session, a second one that never gets content creates no file
+    response = await _request("POST", f"{DRIVE_UPLOAD_URL}/files?uploadType=resumable", "drive.upload",
+                              idempotent=True, json=metadata_payload, headers=session_headers)
+    async with response:
+        response.raise_for_status()
+        session_url = response.headers['Location']
+    metadata_data = { 'session_url': session_url }
+
+    if file_size == 0:
+        response = await _request("PUT", session_url, "drive.upload", headers=_drive_headers(google_token, {"Content-Range": "bytes */0"}))
+        async with response:
+            response.raise_for_status()
+            return metadata_data, await response.json(content_type=None)
+
+    offset = 0
+    file_obj.seek(0)
+    while True:
+        chunk = file_obj.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            raise Exception(f"Upload stopped at byte {offset} of {file_size}")
+
+        chunk_headers = _drive_headers(google_token, {
+            "Content-Type": content_type,
+            "Content-Range": f"bytes {offset}-{offset + len(chunk) - 1}/{file_size}"
+        })
+        response = await _request("PUT", session_url, "drive.upload", data=chunk, headers=chunk_headers, allow_redirects=False)
+        async with response:
+            # 308 means Drive wants the next chunk, its Range header says how much it kept
+            if response.status == 308:
+                received = response.headers.get('Range')
+                offset = int(received.split('-')[-1]) + 1 if received else 0
+                file_obj.seek(offset)
+                continue
+
+            response.raise_for_status()
+            return metadata_data, await response.json(content_type=None)
+
+# Single-flight folder creation within the event loop, the ID cache is shared with api_calls.
+# Names share FOLDER_LOCK_STRIPES locks, made on first use so they belong to the loop.
+FOLDER_LOCK_STRIPES = 64
+_folder_locks = {}
+
+async def create_or_find_folder(google_token, folder_name):
+    folder_id = folder_cache.get((google_token, folder_name))
+    if folder_id is not None:
+        return folder_id
+
+    lock = _folder_locks.setdefault(hash(folder_name) % FOLDER_LOCK_STRIPES, asyncio.Lock())
+    async with lock:
+        folder_id = folder_cache.get((google_token, folder_name))
+        if folder_id is not None:
+            return folder_id
+
+        try:
+            search_params = {
+                "q": f"name={quote_query_value(folder_name)} and mimeType='{FOLDER_MIME_TYPE}' and trashed=false",
+                "fields": "files(id, name)"
+            }
+            response = await _request("GET", f"{DRIVE_BASE_URL}/files", "drive.folder", params=search_params,
+                                      headers=_drive_headers(google_token))
+            async with response:
+                response.raise_for_status()
+                search_data = await response.json(content_type=None)
+
+            if search_data['files']:
+                folder_id = search_data['files'][0]['id']
+            else:
+                create_payload = {
+                    "name": folder_name,
+                    "mimeType": FOLDER_MIME_TYPE
+                }
+                async def parse(response):
+                    response.raise_for_status()
+                    return await response.json(content_type=None)
+
+                async def find():
+                    files = await _find_files(google_token, [f"name={quote_query_value(folder_name)}",
+                                                             f"mimeType='{FOLDER_MIME_TYPE}'"])
+                    return files[0] if files else None
+
+                folder_id = (await _create(f"{DRIVE_BASE_URL}/files", "drive.folder", find, parse, json=create_payload,
+                                           headers=_drive_headers(google_token)))['id']
+
+            folder_cache.set((google_token, folder_name), folder_id)
+            return folder_id
+
+        except REQUEST_ERRORS as e:
+            raise Exception(f"Folder creation/search failed: {str(e)}")
+
+async def list_folder_files(google_token, folder_id):
+    try:
+        list_params = {
+            "q": f"{quote_query_value(folder_id)} in parents and trashed=false",
+            "fields": "nextPageToken, files(id, name, size, appProperties)",
+            "pageSize": "1000"
+        }
+
+        drive_files = []
+        while True:
+            response = await _request("GET", f"{DRIVE_BASE_URL}/files", "drive.list", params=list_params,
+                                      headers=_drive_headers(google_token))
+            async with response:
+                response.raise_for_status()
+                list_data = await response.json(content_type=None)
+            drive_files.extend(list_data['files'])
+
+            page_token = list_data.get('nextPageToken')
+            if not page_token:
+                break
+            list_params['pageToken'] = page_token
+
+        return drive_files
+
+    except REQUEST_ERRORS as e:
+        raise Exception(f"Folder listing failed: {str(e)}")
+
+async def _aiter(candidates):
+    # Accept async iterables directly, pull plain iterators on a worker thread
+    # so a blocking generator (e.g. the sync facade's iter_applications) can't stall the loop
+    if hasattr(candidates, '__aiter__'):
+        async for candidate in candidates:
+            yield candidate
+        return
+
+    loop = asyncio.get_running_loop()
+    iterator = iter(candidates)
+    done = object()
+    while True:
+        candidate = await loop.run_in_executor(None, next, iterator, done)
+        if candidate is done:
+            break
+        yield candidate
+
+async def _lookup_candidate_info(ashby_token, candidate, slots, info_cache=None):
+    # Same as api_calls.lookup_candidate_info, 'listed_id' keeps the ID the candidate was listed under
+    with tracing.span('candidate.info', candidate_id=candidate['id']) as lookup_span:
+        # A cached lookup is still good if it was made after the application last changed
+        updated_at = parse_timestamp(candidate.get('updated_at'))
+        cached = info_cache.get(candidate['id']) if info_cache is not None and updated_at is not None else None
+        if cached is not None and cached[1] > updated_at:
+            lookup_span.set(cached=True)
+            return dict(cached[0], listed_id=candidate['id'])
+
+        async with slots:
+            candidate_info, data = await fetch_candidate_info(ashby_token, candidate['id'])
+        if info_cache is not None:
+            info_cache.set(candidate['id'], candidate_info)
+        return dict(candidate_info, listed_id=candidate['id'])
+
+async def filter_candidates(ashby_token, candidates, max_workers=CANDIDATE_INFO_CONCURRENCY, errors=None, on_result=None, info_cache=None):
+    slots = asyncio.Semaphore(max_workers)
+
+    async def lookup(candidate):
+        candidate_info, error = None, None
+        try:
+            candidate_info = await _lookup_candidate_info(ashby_token, candidate, slots, info_cache)
+        except Exception as e:
+            error = str(e)
+
+        if on_result is not None:
+            on_result(candidate, candidate_info, error)
+        return candidate, candidate_info, error
+
+    # Lookups start as candidates arrive, gather() keeps input order
+    lookups = []
+    async for candidate in _aiter(candidates):
+        lookups.append(asyncio.ensure_future(lookup(candidate)))
+    outcomes = await asyncio.gather(*lookups)
+
+    filtered_candidates = []
+    for candidate, candidate_info, error in outcomes:
+        if error is not None:
+            web_logger.WARNING("Candidate info failed for %s: %s", candidate['id'], error)
+            if errors is not None:
+                errors.append({
+                    'candidate_name': candidate.get('name'),
+                    'candidate_id': candidate['id'],
+                    'error': error
+                })
+            continue
+
+        if candidate_info.get('resume_file_handle') is not None:
+            filtered_candidates.append(candidate_info)
+
+    return filtered_candidates
+
+async def iter_resume_files(ashby_token, candidates, info_cache=None):
+    # Same contract as api_calls.iter_resume_files
+    lookup_slots = asyncio.Semaphore(CANDIDATE_INFO_CONCURRENCY)
+    file_info_slots = asyncio.Semaphore(FILE_INFO_CONCURRENCY)
+    download_slots = asyncio.Semaphore(DOWNLOAD_CONCURRENCY)
+    # Downloads started but not yet taken by the consumer, so a slow consumer
+    # holds back new downloads instead of piling up spooled files
+    unclaimed = asyncio.Semaphore(DOWNLOAD_CONCURRENCY)
+    ready = asyncio.Queue()
+    done = object()
+
+    async def fetch(candidate):
+        result = {
+            'candidate_name': candidate.get('name'),
+            'candidate_id': candidate['id'],
+            'listed_id': candidate['id'],
+            'file_name': None,
+            'file_data': None,
+            'error': None
+        }
+        claimed = False
+        try:
+            candidate_info = await _lookup_candidate_info(ashby_token, candidate, lookup_slots, info_cache)
+            result['candidate_name'] = candidate_info.get('name')
+            result['candidate_id'] = candidate_info['id']
+            file_handle = candidate_info.get('resume_file_handle')
+            if file_handle:
+                async with file_info_slots:
+                    with tracing.span('file.info', candidate_id=candidate['id']):
+                        file_info, raw_file_data = await fetch_file_info(ashby_token, file_handle)
+                await unclaimed.acquire()
+                claimed = True
+                async with download_slots:
+                    with tracing.span('download', candidate_id=candidate['id']) as download_span:
+                        result['file_data'] = await download_file(file_info['url'], stream=True)
+                        download_span.set(bytes=result['file_data']['file_size'])
+                result['file_name'] = resume_file_name(candidate_info)
+        except Exception as e:
+            web_logger.WARNING("Resume fetch failed for %s: %s", candidate['id'], e)
+            result['error'] = str(e)
+        if claimed and result['file_data'] is None:
+            unclaimed.release()
+        ready.put_nowait(result)
+
+    async def produce():
+        fetches = []
+        try:
+            async for candidate in _aiter(candidates):
+                fetches.append(asyncio.ensure_future(fetch(candidate)))
+            await asyncio.gather(*fetches)
+        finally:
+            for task in fetches:
+                task.cancel()
+            ready.put_nowait(done)
+
+    producer = asyncio.ensure_future(produce())
+    try:
+        while True:
+            result = await ready.get()
+            if result is done:
+                break
+            if result['file_data'] is not None:
+                unclaimed.release()
+            yield result
+        await producer
+    finally:
+        # The consumer stopped early, stop the transfers and drop what is waiting
+        producer.cancel()
+        while not ready.empty():
+            result = ready.get_nowait()
+            if result is not done and result['file_data'] is not None:
+                result['file_data']['content'].close()
+
+async def add_resumes(ashby_token, google_token, filtered_candidates, folder_name, manifest=None, on_result=None, run_id=None,
+                      candidate_folders=None):
+    # Same contract as api_calls.add_resumes: one download per candidate, one result per folder
+    folder_ids = {}
+    for name in resume_folder_names(folder_name, candidate_folders):
+        try:
+            folder_ids[name] = await create_or_find_folder(google_token, name)
+        except Exception as e:
+            folder_ids[name] = None
+
+    # Copy sources are only looked up among the files of the token's own Drive account
+    account_id = None
+    if manifest is not None:
+        try:
+            account_id = await get_account_id(google_token)
+        except Exception as e:
+            web_logger.WARNING("Copying in Drive disabled for this run: %s", e)
+
+    # Bring the manifest in line with what the Drive folders hold right now
+    if manifest is not None:
+        for folder_id in dict.fromkeys(folder_id for folder_id in folder_ids.values() if folder_id):
+            try:
+                seeded = manifest.seed_folder(folder_id, await list_folder_files(google_token, folder_id), account_id)
+                web_logger.INFO(f"Manifest seeded with {seeded} exported resumes for folder {folder_id}")
+            except Exception as e:
+                web_logger.WARNING("Manifest seeding failed, using local manifest: %s", e)
+
+    file_info_slots = asyncio.Semaphore(FILE_INFO_CONCURRENCY)
+    download_slots = asyncio.Semaphore(DOWNLOAD_CONCURRENCY)
+    upload_slots = asyncio.Semaphore(UPLOAD_CONCURRENCY)
+    spooled_slots = asyncio.Semaphore(SPOOLED_FILES_LIMIT)
+
+    async def transfer(candidate, targets):
+        candidate_id = candidate.get('id')
+        file_handle = candidate.get('resume_file_handle')
+        if not file_handle:
+            raise Exception('No resume file handle found')
+
+        if manifest is not None:
+            for target in targets:
+                if target['folder_id']:
+                    exported = manifest.get(candidate_id, file_handle, target['folder_id'], resume_file_name(candidate))
+                    if exported is not None:
+                        target['upload_info'] = exported
+        pending = [target for target in targets if 'upload_info' not in target]
+        if not pending:
+            return None
+
+        # A resume Drive already holds in another folder is copied there instead of fetched
+        source = manifest.find_copy(file_handle, account_id) if manifest is not None else None
+        file_info = None
+        file_data = None
+
+        async def fetch():
+            # Held from here until the spooled file is closed after its uploads,
+            # before the file info so the signed URL isn't left to go stale
+            await spooled_slots.acquire()
+            try:
+                # Step 1: Fetch file info from Ashby
+                async with file_info_slots:
+                    started = time.monotonic()
+                    with tracing.span('file.info', candidate_id=candidate_id):
+                        file_info, raw_file_data = await fetch_file_info(ashby_token, file_handle)
+                if events.has_subscribers(run_id):
+                    events.publish(run_id, 'file_info', candidate_id=candidate_id,
+                                   candidate_name=candidate.get('name'), seconds=time.monotonic() - started)
+
+                # Step 2: Stream file from URL into a spooled temp file
+                async with download_slots:
+                    started = time.monotonic()
+                    with tracing.span('download', candidate_id=candidate_id) as download_span:
+                        file_data = await download_file(file_info['url'], stream=True)
+                        download_span.set(bytes=file_data['file_size'])
+            except BaseException:
+                spooled_slots.release()
+                raise
+            if events.has_subscribers(run_id):
+                events.publish(run_id, 'downloaded', candidate_id=candidate_id, candidate_name=candidate.get('name'),
+                               bytes=file_data['file_size'], seconds=time.monotonic() - started)
+            return file_info, file_data
+
+        if source is None:
+            file_info, file_data = await fetch()
+
+        # Step 3: Upload to Google Drive, once per folder that doesn't have it yet
+        app_properties = {
+            'ashbyCandidateId': candidate_id,
+            'ashbyFileHash': handle_digest(file_handle)
+        }
+        try:
+            for target in pending:
+                try:
+                    if source is None and file_data is not None and manifest is not None:
+                        source = manifest.find_content(file_data['sha256'], account_id)
+                    upload_info = None
+                    async with upload_slots:
+                        started = time.monotonic()
+                        if source is not None:
+                            try:
+                                with tracing.span('copy', candidate_id=candidate_id, folder_name=target['folder_name'],
+                                                  source=source['file_id']):
+                                    upload_info, copy_data = await copy_file(google_token, source['file_id'],
+                                                                             resume_file_name(candidate),
+                                                                             target['folder_id'], app_properties)
+                            except Exception as e:
+                                # Throttling that outlasted the retries, permissions and the like, the
+                                # source itself may be fine so the manifest keeps it
+                                web_logger.WARNING("Copy of %s failed, uploading instead: %s", source['file_id'], e)
+                            else:
+                                if upload_info is None:
+                                    web_logger.WARNING("Copy source %s is gone from Drive, uploading instead",
+                                                       source['file_id'])
+                                    if manifest is not None:
+                                        manifest.forget_file(source['file_id'], account_id)
+                            if upload_info is None:
+                                source = None
+                    if upload_info is None:
+                        if file_data is None:
+                            file_info, file_data = await fetch()
+                        app_properties['ashbyContentHash'] = file_data['sha256']
+                        async with upload_slots:
+                            started = time.monotonic()
+                            with tracing.span('upload', candidate_id=candidate_id, folder_name=target['folder_name'],
+                                              bytes=file_data['file_size']):
+                                upload_info, upload_metadata = await upload_file(google_token, resume_file_name(candidate),
+                                                                                 file_data, target['folder_id'],
+                                                                                 app_properties)
+                        if manifest is not None:
+                            manifest.record_content(file_data['sha256'], upload_info, account_id)
+                except Exception as e:
+                    # One folder failing doesn't stop the others
+                    target['error'] = str(e)
+                    continue
+                target['upload_info'] = upload_info
+                # Any further folders get a Drive-side copy of this file
+                source = upload_info
+                if events.has_subscribers(run_id):
+                    event_type = 'copied' if upload_info.get('copied_from') else 'uploaded'
+                    events.publish(run_id, event_type, candidate_id=candidate_id, candidate_name=candidate.get('name'),
+                                   folder_name=target['folder_name'], bytes=upload_info['file_size'],
+                                   seconds=time.monotonic() - started)
+                if manifest is not None and target['folder_id']:
+                    manifest.record(candidate_id, file_handle, target['folder_id'], upload_info, account_id)
+        finally:
+            if file_data is not None:
+                file_data['content'].close()
+                spooled_slots.release()
+        return file_info
+
+    async def export(candidate):
+        names = (candidate_folders or {}).get(candidate.get('id')) or [folder_name]
+        targets = [{'folder_name': name, 'folder_id': folder_ids.get(name)} for name in names]
+        error = None
+        file_info = None
+        try:
+            file_info = await transfer(candidate, targets)
+        except Exception as e:
+            error = str(e)
+
+        results = []
+        for target in targets:
+            result = {
+                'candidate_name': candidate.get('name'),
+                'candidate_id': candidate.get('id'),
+                'folder_name': target['folder_name'],
+                'file_info': None,
+                'upload_info': None,
+                'error': error or target.get('error')
+            }
+            if result['error'] is None:
+                result['file_info'] = file_info
+                result['upload_info'] = target['upload_info']
+                web_logger.DEBUG("Result: %s", result)
+            results.append(result)
+
+            if events.has_subscribers(run_id):
+                if result['error'] is not None:
+                    events.publish(run_id, 'failed', candidate_id=result['candidate_id'],
+                                   candidate_name=result['candidate_name'], folder_name=target['folder_name'],
+                                   error=result['error'])
+                elif result['upload_info'].get('skipped'):
+                    events.publish(run_id, 'skipped', candidate_id=result['candidate_id'],
+                                   candidate_name=result['candidate_name'], folder_name=target['folder_name'])
+            if on_result is not None:
+                on_result(result)
+        return results
+
+    exported = await asyncio.gather(*(export(candidate) for candidate in filtered_candidates))
+    return [result for results in exported for result in results]
+
+
+# Sync facade: every call runs on one background event loop shared by all threads
+_loop = None
+# Seconds an abandoned iterator gets to release its files and connections
+CLEANUP_TIMEOUT = 10
+_loop_lock = threading.Lock()
+
+def _get_loop():
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name='async-api-calls', daemon=True).start()
+        return _loop
+
+@atexit.register
+def _close_loop():
+    if _loop is not None and _loop.is_running():
+        asyncio.run_coroutine_threadsafe(close_session(), _loop).result(timeout=5)
+
+async def _traced(trace, awaitable):
+    with tracing.attached(trace):
+        return await awaitable
+
+def run_sync(coroutine, timeout=None):
+    # The calling thread's trace, if it is recording one, records the coroutine too
+    trace = tracing.current()
+    if trace is not None:
+        coroutine = _traced(trace, coroutine)
+    future = asyncio.run_coroutine_threadsafe(coroutine, _get_loop())
+    try:
+        return future.result(timeout)
+    except concurrent.futures.TimeoutError:
+        future.cancel()
+        raise
+
+def _iter_sync(async_iterator):
+    # Drive an async generator from a plain thread, one item per loop round trip
+    try:
+        while True:
+            try:
+                yield run_sync(async_iterator.__anext__())
+            except StopAsyncIteration:
+                return
+    finally:
+        # Runs the async generator's cleanup if the caller stopped early. While the
+        # interpreter shuts down the loop thread is frozen and would never answer.
+        if not sys.is_finalizing() and _loop is not None and _loop.is_running():
+            try:
+                run_sync(async_iterator.aclose(), timeout=CLEANUP_TIMEOUT)
+            except concurrent.futures.TimeoutError:
+                web_logger.WARNING("Gave up closing an async iterator after %ss", CLEANUP_TIMEOUT)
+
+
+class SyncFacade:
+    def fetch_jobs(self, ashby_token):
+        return run_sync(fetch_jobs(ashby_token))
+
+    def fetch_applications(self, ashby_token, filters):
+        return run_sync(fetch_applications(ashby_token, filters))
+
+    def iter_jobs(self, ashby_token, raw_pages=None):
+        return _iter_sync(iter_jobs(ashby_token, raw_pages))
+
+    def iter_applications(self, ashby_token, filters, raw_pages=None):
+        return _iter_sync(iter_applications(ashby_token, filters, raw_pages))
+
+    def fetch_candidate_info(self, ashby_token, candidate_id):
+        return run_sync(fetch_candidate_info(ashby_token, candidate_id))
+
+    def fetch_file_info(self, ashby_token, file_handle):
+        return run_sync(fetch_file_info(ashby_token, file_handle))
+
+    def download_file(self, file_url, stream=False):
+        return run_sync(download_file(file_url, stream))
+
+    def upload_file(self, google_token, file_name, file_data, folder_id=None, app_properties=None):
+        return run_sync(upload_file(google_token, file_name, file_data, folder_id, app_properties))
+
+    def copy_file(self, google_token, source_file_id, file_name, folder_id=None, app_properties=None):
+        return run_sync(copy_file(google_token, source_file_id, file_name, folder_id, app_properties))
+
+    def get_account_id(self, google_token):
+        return run_sync(get_account_id(google_token))
+
+    def create_or_find_folder(self, google_token, folder_name):
+        return run_sync(create_or_find_folder(google_token, folder_name))
+
+    def filter_candidates(self, ashby_token, candidates, **options):
+        return run_sync(filter_candidates(ashby_token, candidates, **options))
+
+    def iter_resume_files(self, ashby_token, candidates, **options):
+        return _iter_sync(iter_resume_files(ashby_token, candidates, **options))
+
+    def add_resumes(self, ashby_token, google_token, filtered_candidates, folder_name, **options):
+        return run_sync(add_resumes(ashby_token, google_token, filtered_candidates, folder_name, **options))
+
+sync_api = SyncFacade()
@@ -0,0 +1,116 @@
+import threading
+import time
+import json
+from sqlite_store import SQLiteStore
+
+# Loads are serialised per key on a fixed set of locks, so the locks stay bounded
+# however many keys pass through. Keys sharing a stripe just wait on each other.
+KEY_LOCK_STRIPES = 64
+
+
+class TTLCache:
+    def __init__(self, ttl, max_entries=1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._key_locks = [threading.Lock() for _ in range(KEY_LOCK_STRIPES)]
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            # Oldest entries go first once the cache is full
+            while len(self._entries) > self.max_entries:
+                del self._entries[next(iter(self._entries))]
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def invalidate_value(self, value):
+        with self._lock:
+            for key in [key for key, entry in self._entries.items() if entry[0] == value]:
+                del self._entries[key]
+
+    def lock_for(self, key):
+        # Concurrent loads of the same entry run only once, don't take a second key's lock while holding one
+        return self._key_locks[hash(key) % KEY_LOCK_STRIPES]
+
+    def get_or_load(self, key, loader):
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        with self.lock_for(key):
+            value = self.get(key)
+            if value is None:
+                value = loader()
+                self.set(key, value)
+            return value
+
+
+class DiskLRUCache(SQLiteStore):
+    def __init__(self, path, max_entries=50000):
+        super().__init__(path)
+        self.max_entries = max_entries
+        with self._lock, self._connection:
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    stored_at REAL NOT NULL,
+                    used_at REAL NOT NULL
+                )
+            """)
+            self._connection.execute("CREATE INDEX IF NOT EXISTS entries_used_at ON entries (used_at)")
+
+    def get(self, key):
+        # Returns (value, stored_at) or None, and marks the entry as recently used
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT value, stored_at FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._connection.execute("UPDATE entries SET used_at = ? WHERE key = ?", (time.time(), key))
+
+        value, stored_at = row
+        return json.loads(value), stored_at
+
+    def set(self, key, value):
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now, now)
+            )
+            # Evict the least recently used entries once over the bound
+            count = self._connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            if count > self.max_entries:
+                self._connection.execute(
+                    "DELETE FROM entries WHERE key IN "
+                    "(SELECT key FROM entries ORDER BY used_at LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+
+    def invalidate(self, key=None):
+        with self._lock, self._connection:
+            if key is None:
+                self._connection.execute("DELETE FROM entries")
+            else:
+                self._connection.execute("DELETE FROM entries WHERE key = ?", (key,))
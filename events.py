@@ -0,0 +1,46 @@
+import queue
+import threading
+import time
+
+# Events buffered per subscriber before the oldest ones are dropped
+SUBSCRIBER_QUEUE_SIZE = 1000
+
+# topic -> list of subscriber queues, only topics with listeners are present
+_subscribers = {}
+_lock = threading.Lock()
+
+def has_subscribers(topic):
+    # Lock-free check so publishers can skip building events nobody will read
+    return topic in _subscribers
+
+def publish(topic, event_type, **fields):
+    subscribers = _subscribers.get(topic)
+    if not subscribers:
+        return
+
+    event = {'type': event_type, 'time': time.time()}
+    event.update(fields)
+    for subscriber in list(subscribers):
+        try:
+            subscriber.put_nowait(event)
+        except queue.Full:
+            # A slow reader loses its oldest event rather than stalling the publisher
+            try:
+                subscriber.get_nowait()
+                subscriber.put_nowait(event)
+            except (queue.Empty, queue.Full):
+                pass
+
+def subscribe(topic):
+    subscriber = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+    with _lock:
+        _subscribers[topic] = _subscribers.get(topic, []) + [subscriber]
+    return subscriber
+
+def unsubscribe(topic, subscriber):
+    with _lock:
+        remaining = [item for item in _subscribers.get(topic, []) if item is not subscriber]
+        if remaining:
+            _subscribers[topic] = remaining
+        else:
+            _subscribers.pop(topic, None)
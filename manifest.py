@@ -0,0 +1,201 @@
+import time
+import hashlib
+from sqlite_store import SQLiteStore
+
+MANIFEST_PATH = "sync_manifest.db"
+
+
+def handle_digest(file_handle):
+    # Ashby file handles are too long for a Drive appProperty (124 bytes per
+    # key and value), so resumes are tracked by a digest of the handle
+    return hashlib.sha256(file_handle.encode()).hexdigest()
+
+
+class SyncManifest(SQLiteStore):
+    def __init__(self, path=MANIFEST_PATH):
+        super().__init__(path)
+        with self._lock, self._connection:
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS exported (
+                    candidate_id TEXT NOT NULL,
+                    handle_digest TEXT NOT NULL,
+                    folder_id TEXT NOT NULL,
+                    file_id TEXT NOT NULL,
+                    file_name TEXT,
+                    file_size INTEGER,
+                    exported_at REAL NOT NULL,
+                    account TEXT,
+                    PRIMARY KEY (candidate_id, handle_digest, folder_id)
+                )
+            """)
+            self._connection.execute("CREATE INDEX IF NOT EXISTS exported_handle ON exported (handle_digest)")
+            # The Drive account (permissionId) the file belongs to, copy sources are
+            # only ever looked up within the account. NULL for files recorded before.
+            self._add_column('exported', 'account', 'TEXT')
+            # Rows from before content was scoped to an account can't be told apart,
+            # the table is rebuilt and refilled as folders are seeded
+            content_columns = [row[1] for row in self._connection.execute("PRAGMA table_info(content)")]
+            if content_columns and 'account' not in content_columns:
+                self._connection.execute("DROP TABLE content")
+            # SHA-256 of the resume bytes -> a Drive file of the account holding them, in any folder
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS content (
+                    content_digest TEXT NOT NULL,
+                    account TEXT NOT NULL,
+                    file_id TEXT NOT NULL,
+                    file_name TEXT,
+                    file_size INTEGER,
+                    recorded_at REAL NOT NULL,
+                    PRIMARY KEY (content_digest, account)
+                )
+            """)
+            # Files of a seeded folder without our appProperties, uploaded before they were
+            # written. Matched to candidates by resume_file_name() when they come up.
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS untagged (
+                    folder_id TEXT NOT NULL,
+                    file_name TEXT NOT NULL,
+                    file_id TEXT NOT NULL,
+                    file_size INTEGER,
+                    account TEXT,
+                    PRIMARY KEY (folder_id, file_name)
+                )
+            """)
+
+    def get(self, candidate_id, file_handle, folder_id, file_name=None):
+        # With file_name, an untagged file of that name in the folder counts as this
+        # resume and is recorded as such
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT file_id, file_name, file_size FROM exported "
+                "WHERE candidate_id = ? AND handle_digest = ? AND folder_id = ?",
+                (candidate_id, handle_digest(file_handle), folder_id)
+            ).fetchone()
+            if row is None and file_name is not None:
+                row = self._claim_untagged(candidate_id, file_handle, folder_id, file_name)
+
+        if row is None:
+            return None
+
+        file_id, file_name, file_size = row
+        return {
+            'file_id': file_id,
+            'file_name': file_name,
+            'file_size': file_size,
+            'upload_success': True,
+            'skipped': True
+        }
+
+    def _claim_untagged(self, candidate_id, file_handle, folder_id, file_name):
+        # The caller holds the lock
+        untagged = self._connection.execute(
+            "SELECT file_id, file_size, account FROM untagged WHERE folder_id = ? AND file_name = ?",
+            (folder_id, file_name)
+        ).fetchone()
+        if untagged is None:
+            return None
+        file_id, file_size, account = untagged
+        with self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO exported (candidate_id, handle_digest, folder_id, file_id, file_name, "
+                "file_size, exported_at, account) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (candidate_id, handle_digest(file_handle), folder_id, file_id, file_name, file_size, time.time(),
+                 account)
+            )
+        return file_id, file_name, file_size
+
+    def find_copy(self, file_handle, account):
+        # Any Drive file of the account already holding this resume, whatever folder it is in
+        if account is None:
+            return None
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT file_id, file_name, file_size FROM exported WHERE handle_digest = ? AND account = ? "
+                "ORDER BY exported_at DESC LIMIT 1",
+                (handle_digest(file_handle), account)
+            ).fetchone()
+        return self._copy_source(row)
+
+    def find_content(self, content_digest, account):
+        # A Drive file of the account with exactly these bytes, even if it came from another file handle
+        if account is None:
+            return None
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT file_id, file_name, file_size FROM content WHERE content_digest = ? AND account = ?",
+                (content_digest, account)
+            ).fetchone()
+        return self._copy_source(row)
+
+    def _copy_source(self, row):
+        if row is None:
+            return None
+        file_id, file_name, file_size = row
+        return {'file_id': file_id, 'file_name': file_name, 'file_size': file_size}
+
+    def record_content(self, content_digest, upload_info, account):
+        if account is None:
+            return
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO content VALUES (?, ?, ?, ?, ?, ?)",
+                (content_digest, account, upload_info['file_id'], upload_info.get('file_name'),
+                 upload_info.get('file_size'), time.time())
+            )
+
+    def forget_file(self, file_id, account):
+        # Drop a Drive file the account's Drive reported as not found, wherever it is referenced
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM exported WHERE file_id = ? AND account = ?", (file_id, account))
+            self._connection.execute("DELETE FROM content WHERE file_id = ? AND account = ?", (file_id, account))
+
+    def record(self, candidate_id, file_handle, folder_id, upload_info, account=None):
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO exported (candidate_id, handle_digest, folder_id, file_id, file_name, "
+                "file_size, exported_at, account) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (candidate_id, handle_digest(file_handle), folder_id, upload_info['file_id'],
+                 upload_info.get('file_name'), upload_info.get('file_size'), time.time(), account)
+            )
+
+    def forget(self, candidate_id, file_handle, folder_id):
+        with self._lock, self._connection:
+            self._connection.execute(
+                "DELETE FROM exported WHERE candidate_id = ? AND handle_digest = ? AND folder_id = ?",
+                (candidate_id, handle_digest(file_handle), folder_id)
+            )
+
+    def seed_folder(self, folder_id, drive_files, account=None):
+        # Replace what we know about a folder with what Drive actually holds,
+        # so resumes deleted from Drive get exported again on the next run
+        rows = []
+        content_rows = []
+        untagged_rows = []
+        for drive_file in drive_files:
+            app_properties = drive_file.get('appProperties') or {}
+            candidate_id = app_properties.get('ashbyCandidateId')
+            file_hash = app_properties.get('ashbyFileHash')
+            file_size = int(drive_file.get('size') or 0)
+            if not candidate_id or not file_hash:
+                if drive_file.get('name'):
+                    untagged_rows.append((folder_id, drive_file['name'], drive_file['id'], file_size, account))
+                continue
+            rows.append((candidate_id, file_hash, folder_id, drive_file['id'],
+                         drive_file.get('name'), file_size, time.time(), account))
+            content_hash = app_properties.get('ashbyContentHash')
+            if content_hash and account is not None:
+                content_rows.append((content_hash, account, drive_file['id'], drive_file.get('name'),
+                                     file_size, time.time()))
+
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM exported WHERE folder_id = ?", (folder_id,))
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO exported (candidate_id, handle_digest, folder_id, file_id, file_name, "
+                "file_size, exported_at, account) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            self._connection.executemany("INSERT OR REPLACE INTO content VALUES (?, ?, ?, ?, ?, ?)", content_rows)
+            self._connection.execute("DELETE FROM untagged WHERE folder_id = ?", (folder_id,))
+            self._connection.executemany("INSERT OR REPLACE INTO untagged VALUES (?, ?, ?, ?, ?)", untagged_rows)
+
+        return len(rows) + len(untagged_rows)
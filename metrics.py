@@ -0,0 +1,141 @@
+import bisect
+import threading
+
+# Latency buckets in seconds, from quick API calls up to large resume transfers
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Every metric created through counter() or histogram(), in creation order
+_registry = []
+_registry_lock = threading.Lock()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(label_names, label_values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(label_names, label_values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{_escape(extra[1])}"')
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            lines.append(f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [per-bucket counts with a trailing +Inf slot, sum, count]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.label_names)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                self._values[key] = entry
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            values = sorted((key, (list(entry[0]), entry[1], entry[2])) for key, entry in self._values.items())
+        for key, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.label_names, key, ('le', _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+def _register(metric):
+    with _registry_lock:
+        _registry.append(metric)
+    return metric
+
+def counter(name, help_text, label_names=()):
+    return _register(Counter(name, help_text, label_names))
+
+def histogram(name, help_text, label_names=(), buckets=DEFAULT_BUCKETS):
+    return _register(Histogram(name, help_text, label_names, buckets))
+
+def render():
+    # Prometheus text exposition format, version 0.0.4
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+# Outbound API calls, labelled by upstream endpoint (job.list, download, drive.upload, ...)
+api_request_seconds = histogram(
+    'recruiter_api_request_duration_seconds',
+    'Time for one upstream HTTP attempt, until the response headers for streamed downloads',
+    ['endpoint']
+)
+api_responses = counter(
+    'recruiter_api_responses_total',
+    'Upstream HTTP attempts by response status, "error" for dropped connections and timeouts',
+    ['endpoint', 'status']
+)
+api_retries = counter(
+    'recruiter_api_retries_total',
+    'Upstream HTTP attempts that were retried',
+    ['endpoint']
+)
+api_sent_bytes = counter(
+    'recruiter_api_sent_bytes_total',
+    'Request body bytes sent upstream',
+    ['endpoint']
+)
+api_received_bytes = counter(
+    'recruiter_api_received_bytes_total',
+    'Response body bytes received from upstream',
+    ['endpoint']
+)
+
+def observe_api_call(endpoint, status, seconds, sent_bytes=0, received_bytes=0):
+    api_request_seconds.observe(seconds, endpoint=endpoint)
+    api_responses.inc(endpoint=endpoint, status=status)
+    if sent_bytes:
+        api_sent_bytes.inc(sent_bytes, endpoint=endpoint)
+    if received_bytes:
+        api_received_bytes.inc(received_bytes, endpoint=endpoint)
@@ -0,0 +1,151 @@
+import contextvars
+import queue
+import threading
+
+# Marker pushed down a stage queue once the stage above it has drained
+_STOP = object()
+
+
+class Stage:
+    def __init__(self, name, function, workers=1):
+        self.name = name
+        self.function = function
+        self.workers = max(1, workers)
+
+
+# Push every item through the stages in order. Each stage has its own worker
+# pool and hands items to the next stage over a bounded queue, so item N+1 can
+# be in stage 1 while item N is still in stage 2. A stage function takes the
+# item and returns it (possibly updated); if it raises, the item skips the
+# remaining stages. Returns (item, error) tuples in input order; on_result, if
+# given, is called with each (item, error) as soon as it leaves the last stage.
+def run_pipeline(items, stages, queue_size=16, on_result=None):
+    output = queue.Queue()
+    threads, feed_errors = _start(items, stages, queue_size, output)
+
+    collected = {}
+    while True:
+        task = output.get()
+        if task is _STOP:
+            break
+        index, item, error = task
+        collected[index] = (item, error)
+        if on_result is not None:
+            on_result(item, error)
+
+    for thread in threads:
+        thread.join()
+
+    if feed_errors:
+        raise feed_errors[0]
+
+    return [collected[index] for index in sorted(collected)]
+
+
+# Same stages as run_pipeline, but yields (item, error) in the order items
+# finish while later items are still being worked on. At most queue_size
+# finished items wait for the consumer, which holds back the stages above.
+# If the consumer stops early the remaining items are failed without being
+# run and handed to discard, if given, from a background thread.
+def iter_pipeline(items, stages, queue_size=16, discard=None):
+    output = queue.Queue(maxsize=queue_size)
+    cancelled = threading.Event()
+    threads, feed_errors = _start(items, stages, queue_size, output, cancelled)
+
+    finished = False
+    try:
+        while True:
+            task = output.get()
+            if task is _STOP:
+                finished = True
+                break
+            index, item, error = task
+            yield item, error
+    finally:
+        if not finished:
+            cancelled.set()
+            threading.Thread(target=_drain, args=(output, discard), name="pipeline-drain", daemon=True).start()
+
+    for thread in threads:
+        thread.join()
+
+    if feed_errors:
+        raise feed_errors[0]
+
+
+def _drain(output, discard):
+    while True:
+        task = output.get()
+        if task is _STOP:
+            return
+        index, item, error = task
+        if discard is not None:
+            discard(item)
+
+
+def _start(items, stages, queue_size, output, cancelled=None):
+    queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+    threads = []
+    feed_errors = []
+
+    def feed():
+        try:
+            for index, item in enumerate(items):
+                if cancelled is not None and cancelled.is_set():
+                    break
+                queues[0].put((index, item, None))
+        except Exception as e:
+            feed_errors.append(e)
+        finally:
+            for _ in range(stages[0].workers):
+                queues[0].put(_STOP)
+
+    def work(position, stage, state):
+        inbox = queues[position]
+        last = position == len(stages) - 1
+        outbox = output if last else queues[position + 1]
+
+        while True:
+            task = inbox.get()
+            if task is _STOP:
+                break
+
+            index, item, error = task
+            if error is None and cancelled is not None and cancelled.is_set():
+                error = "Cancelled"
+            if error is None:
+                try:
+                    item = stage.function(item)
+                except Exception as e:
+                    error = str(e)
+            outbox.put((index, item, error))
+
+        # The last worker out tells the next stage there is nothing more coming
+        with state['lock']:
+            state['running'] -= 1
+            finished = state['running'] == 0
+        if finished:
+            if last:
+                output.put(_STOP)
+            else:
+                for _ in range(stages[position + 1].workers):
+                    outbox.put(_STOP)
+
+    # Every thread runs in its own copy of the caller's context, so context
+    # variables such as the run's trace carry over into the workers
+    threads.append(threading.Thread(target=contextvars.copy_context().run, args=(feed,),
+                                    name="pipeline-feed", daemon=True))
+    for position, stage in enumerate(stages):
+        state = {'lock': threading.Lock(), 'running': stage.workers}
+        for number in range(stage.workers):
+            threads.append(threading.Thread(
+                target=contextvars.copy_context().run,
+                args=(work, position, stage, state),
+                name=f"pipeline-{stage.name}-{number}",
+                daemon=True
+            ))
+
+    for thread in threads:
+        thread.start()
+
+    return threads, feed_errors
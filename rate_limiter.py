@@ -0,0 +1,251 @@
+import asyncio
+import email.utils
+import random
+import re
+import threading
+import time
+from urllib.parse import urlsplit
+import requests
+import web_logger
+import metrics
+import tracing
+
+# Attempts after the first one for 429s, 5xxs and dropped connections
+MAX_RETRIES = 5
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30
+
+# Longest Retry-After we will honour before giving up on waiting that long
+RETRY_AFTER_MAX = 120
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Methods that are safe to send again when the server may already have acted on
+# an attempt (5xxs, dropped connections). POSTs that only read, like Ashby's, or
+# that only open a resumable upload session are marked idempotent by the caller.
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+
+# Retried like a 5xx, ChunkedEncodingError is a connection dropped mid-body
+DROPPED_CONNECTION_ERRORS = (
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+    requests.exceptions.ChunkedEncodingError
+)
+
+# Lower-cased reason in the body of a Drive 403 that is really a 429
+THROTTLED_REASON = 'ratelimitexceeded'
+
+# Error messages worth trying again later: throttling, 5xxs after the retries ran
+# out, timeouts and dropped connections. Status codes follow the "...failed: "
+# prefix the API wrappers put on requests' and aiohttp's error messages.
+TRANSIENT_ERROR = re.compile(
+    r": (429|500|502|503|504)\b|timed out|timeout|connection|ratelimitexceeded|upload stopped|cancelled",
+    re.IGNORECASE
+)
+
+# Requests per second, bucket size and concurrency ceiling per upstream host
+HOST_LIMITS = {
+    'api.ashbyhq.com': {'rate': 10, 'burst': 20, 'max_concurrency': 16},
+    'www.googleapis.com': {'rate': 10, 'burst': 20, 'max_concurrency': 8}
+}
+
+# Anything else, mostly the signed resume download URLs
+DEFAULT_LIMITS = {'rate': 50, 'burst': 50, 'max_concurrency': 32}
+
+# Seconds a coroutine waits before checking a host that is at its concurrency
+# limit again, threads are woken by release() instead
+ASYNC_POLL_INTERVAL = 0.05
+
+# Concurrency is cut at most once per this many seconds, so a burst of 429s
+# from requests already in flight counts as one overload signal
+DECREASE_INTERVAL = 1.0
+
+
+class HostLimiter:
+    def __init__(self, rate, burst, max_concurrency, min_concurrency=1):
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        # Start halfway and let successes ramp the limit up
+        self.concurrency = max(min_concurrency, max_concurrency / 2)
+        self.tokens = burst
+        self.in_flight = 0
+        self.paused_until = 0
+        self._refilled_at = time.monotonic()
+        self._decreased_at = 0
+        self._condition = threading.Condition()
+
+    def _try_acquire(self):
+        # Takes a slot and returns 0, or how long to wait first, None until a release().
+        # The caller holds the condition.
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.in_flight >= int(self.concurrency):
+            return None
+        if self.tokens < 1:
+            return (1 - self.tokens) / self.rate
+        self.tokens -= 1
+        self.in_flight += 1
+        return 0
+
+    def acquire(self):
+        with self._condition:
+            while True:
+                wait = self._try_acquire()
+                if wait == 0:
+                    return
+                self._condition.wait(wait)
+
+    async def acquire_async(self):
+        # Same slots and AIMD state as acquire(), shared with the threads using this host.
+        # The condition is only held for the check, the wait happens on the event loop.
+        while True:
+            with self._condition:
+                wait = self._try_acquire()
+            if wait == 0:
+                return
+            await asyncio.sleep(ASYNC_POLL_INTERVAL if wait is None else wait)
+
+    def release(self, status_code=None):
+        # AIMD: halve the concurrency on overload, grow it by about one per round of successes
+        with self._condition:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if status_code is None or status_code in RETRY_STATUS_CODES:
+                if now - self._decreased_at > DECREASE_INTERVAL:
+                    self.concurrency = max(self.min_concurrency, self.concurrency / 2)
+                    self._decreased_at = now
+            else:
+                self.concurrency = min(self.max_concurrency, self.concurrency + 1 / self.concurrency)
+            self._condition.notify_all()
+
+    def pause(self, seconds):
+        # Hold every request to this host, used for Retry-After on a 429
+        with self._condition:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self._condition.notify_all()
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+def get_limiter(host):
+    with _limiters_lock:
+        limiter = _limiters.get(host)
+        if limiter is None:
+            limiter = HostLimiter(**HOST_LIMITS.get(host, DEFAULT_LIMITS))
+            _limiters[host] = limiter
+        return limiter
+
+def retry_after_seconds(response):
+    # Retry-After is either a number of seconds or an HTTP date
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = email.utils.parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(max(seconds, 0), RETRY_AFTER_MAX)
+
+def _is_throttled(response):
+    # Drive reports quota exhaustion as a 403 with a rateLimitExceeded reason
+    if response.status_code == 429:
+        return True
+    return response.status_code == 403 and THROTTLED_REASON in response.text.lower()
+
+def classify_error(message):
+    # 'transient' if a later attempt may succeed, 'permanent' if it needs fixing first
+    if message and TRANSIENT_ERROR.search(message):
+        return 'transient'
+    return 'permanent'
+
+def backoff_delay(attempt):
+    # Exponential backoff with full jitter
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+def _body_size(body):
+    if body is None:
+        return 0
+    try:
+        return len(body)
+    except TypeError:
+        # Streamed bodies don't know their size up front
+        return 0
+
+def _observe(endpoint, response, seconds, stream):
+    if response is None:
+        metrics.observe_api_call(endpoint, 'error', seconds)
+        return
+    if stream:
+        received = int(response.headers.get('Content-Length') or 0)
+    else:
+        received = len(response.content)
+    metrics.observe_api_call(endpoint, response.status_code, seconds,
+                             _body_size(response.request.body), received)
+
+def is_idempotent(method, idempotent=None):
+    return method.upper() in IDEMPOTENT_METHODS if idempotent is None else idempotent
+
+def request(session, method, url, endpoint=None, idempotent=None, **kwargs):
+    # Send through the host's limiter, retrying 429s, 5xxs and dropped connections.
+    # The last response is returned as is, so callers still raise_for_status().
+    # endpoint labels the call in the metrics, the host is used when it is missing.
+    # A request that isn't idempotent is only retried when it was throttled, see
+    # IDEMPOTENT_METHODS, its 5xxs are returned and dropped connections raised.
+    host = urlsplit(url).hostname
+    endpoint = endpoint or host
+    limiter = get_limiter(host)
+    retry_unknown = is_idempotent(method, idempotent)
+    attempt = 0
+    while True:
+        with tracing.span('limiter.wait', 'http', host=host):
+            limiter.acquire()
+        started = time.monotonic()
+        response = None
+        # Status the slot is released with, None counts as a dropped connection
+        status = None
+        try:
+            with tracing.span(f"HTTP {endpoint}", 'http', method=method, attempt=attempt) as http_span:
+                response = session.request(method, url, **kwargs)
+                http_span.set(status=response.status_code)
+            # Reads the body unless streaming, a connection dropped mid-body raises here
+            _observe(endpoint, response, time.monotonic() - started, kwargs.get('stream', False))
+            throttled = _is_throttled(response)
+            status = 429 if throttled else response.status_code
+        except DROPPED_CONNECTION_ERRORS as e:
+            _observe(endpoint, None, time.monotonic() - started, False)
+            if response is not None:
+                response.close()
+            if attempt >= MAX_RETRIES or not retry_unknown:
+                raise
+            delay = backoff_delay(attempt)
+            reason = str(e)
+        else:
+            retry = throttled or (retry_unknown and response.status_code in RETRY_STATUS_CODES)
+            if not retry or attempt >= MAX_RETRIES:
+                return response
+            delay = retry_after_seconds(response)
+            if delay is None:
+                delay = backoff_delay(attempt)
+            if throttled:
+                limiter.pause(delay)
+            reason = f"HTTP {response.status_code}"
+            response.close()
+        finally:
+            # Whatever the attempt raised, a leaked slot would stall the host for good
+            limiter.release(status)
+
+        metrics.api_retries.inc(endpoint=endpoint)
+        web_logger.WARNING("Retrying %s %s in %.1fs after %s (attempt %d)", method, urlsplit(url).path, delay, reason, attempt + 1)
+        with tracing.span('backoff', 'http', endpoint=endpoint, reason=reason):
+            time.sleep(delay)
+        attempt += 1
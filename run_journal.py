@@ -0,0 +1,327 @@
+import json
+import time
+from sqlite_store import SQLiteStore
+from rate_limiter import classify_error
+
+RUN_JOURNAL_PATH = "run_journal.db"
+
+# Version 1 journals kept the API tokens at the start of a run's arguments,
+# version 2 arguments never hold credentials
+ARGS_VERSION = 2
+
+
+class RunJournal(SQLiteStore):
+    # Durable record of each export run: what it was asked to do, the candidates
+    # it settled on and every upload it finished, so a run cut short by a crash
+    # or restart can carry on from its last checkpoint. The API tokens a run was
+    # started with are never written here, see runs.submit_run(). The file still
+    # names candidates, so it is created readable by the server's user only.
+    def __init__(self, path=RUN_JOURNAL_PATH):
+        super().__init__(path, private=True)
+        with self._lock, self._connection:
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS runs (
+                    run_id TEXT PRIMARY KEY,
+                    job_name TEXT,
+                    target TEXT NOT NULL,
+                    args TEXT NOT NULL,
+                    traced INTEGER NOT NULL,
+                    status TEXT NOT NULL,
+                    counts TEXT,
+                    message TEXT,
+                    error TEXT,
+                    listed INTEGER NOT NULL DEFAULT 0,
+                    submitted_at REAL NOT NULL,
+                    finished_at REAL,
+                    owner TEXT,
+                    heartbeat_at REAL,
+                    args_version INTEGER NOT NULL DEFAULT 1
+                )
+            """)
+            # Journals written before runs had an owning worker process
+            self._add_column('runs', 'owner', 'TEXT')
+            self._add_column('runs', 'heartbeat_at', 'REAL')
+            self._add_column('runs', 'args_version', 'INTEGER NOT NULL DEFAULT 1')
+            self._drop_journaled_tokens()
+            # Candidates with a resume, written once the run has listed and looked them all up
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS candidates (
+                    run_id TEXT NOT NULL,
+                    candidate_id TEXT NOT NULL,
+                    candidate TEXT NOT NULL,
+                    folders TEXT NOT NULL,
+                    PRIMARY KEY (run_id, candidate_id)
+                )
+            """)
+            # One row per candidate and folder once its upload finished or failed
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS uploads (
+                    run_id TEXT NOT NULL,
+                    candidate_id TEXT NOT NULL,
+                    folder_name TEXT NOT NULL,
+                    candidate_name TEXT,
+                    file_id TEXT,
+                    error TEXT,
+                    updated_at REAL NOT NULL,
+                    error_class TEXT,
+                    PRIMARY KEY (run_id, candidate_id, folder_name)
+                )
+            """)
+            # Journals written before failures were classified
+            self._add_column('uploads', 'error_class', 'TEXT')
+            # Candidates whose candidate.info lookup failed, so never reached the uploads
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS lookup_failures (
+                    run_id TEXT NOT NULL,
+                    candidate_id TEXT NOT NULL,
+                    candidate_name TEXT,
+                    folders TEXT NOT NULL,
+                    error TEXT NOT NULL,
+                    error_class TEXT NOT NULL,
+                    PRIMARY KEY (run_id, candidate_id)
+                )
+            """)
+            # Chrome trace JSON of traced runs, for download from any worker
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS traces (
+                    run_id TEXT PRIMARY KEY,
+                    trace TEXT NOT NULL
+                )
+            """)
+
+    def _drop_journaled_tokens(self):
+        # Both run targets took the Ashby and Google tokens as their first two
+        # arguments, unfinished runs keep the rest to be resumed with new tokens.
+        # Call inside the connection's transaction.
+        rows = self._connection.execute(
+            "SELECT run_id, args, finished_at FROM runs WHERE args_version < ?", (ARGS_VERSION,)
+        ).fetchall()
+        for run_id, args, finished_at in rows:
+            args = json.loads(args)
+            args = args[2:] if finished_at is None and args is not None else None
+            self._connection.execute(
+                "UPDATE runs SET args = ?, args_version = ? WHERE run_id = ?", (json.dumps(args), ARGS_VERSION, run_id)
+            )
+
+    def add_run(self, run, target, args, owner=None):
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO runs (run_id, job_name, target, args, traced, status, counts, submitted_at, "
+                "owner, heartbeat_at, args_version) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (run.run_id, run.job_name, target, json.dumps(args), int(run.traced), run.status,
+                 json.dumps(run.counts), run.submitted_at, owner, time.time(), ARGS_VERSION)
+            )
+
+    def heartbeat(self, owner, run_ids):
+        # Renews the owner's lease on runs it is still working on, returns the IDs
+        # of those another worker has taken over in the meantime
+        now = time.time()
+        lost = []
+        with self._lock, self._connection:
+            for run_id in run_ids:
+                cursor = self._connection.execute(
+                    "UPDATE runs SET heartbeat_at = ? WHERE run_id = ? AND owner = ?", (now, run_id, owner)
+                )
+                if cursor.rowcount == 0:
+                    lost.append(run_id)
+        return lost
+
+    def claim_stale_runs(self, owner, stale_before):
+        # Takes over unfinished runs whose owner stopped renewing its lease, each
+        # one claimed by exactly one worker however many look at the same time.
+        # A worker never claims its own runs, a late heartbeat doesn't mean it died.
+        # Interrupted runs have no lease, they wait for claim_interrupted().
+        claimed = []
+        for row in self.unfinished_runs():
+            with self._lock, self._connection:
+                cursor = self._connection.execute(
+                    "UPDATE runs SET owner = ?, heartbeat_at = ? WHERE run_id = ? AND finished_at IS NULL "
+                    "AND status != 'interrupted' AND (heartbeat_at IS NULL OR heartbeat_at < ?) "
+                    "AND (owner IS NULL OR owner != ?)",
+                    (owner, time.time(), row['run_id'], stale_before, owner)
+                )
+            if cursor.rowcount == 1:
+                claimed.append(row)
+        return claimed
+
+    def claim_interrupted(self, run_id, owner):
+        # Takes an interrupted run back up, returns its row or None if it isn't
+        # interrupted (any more, another request may have resumed it first)
+        with self._lock, self._connection:
+            cursor = self._connection.execute(
+                "UPDATE runs SET owner = ?, heartbeat_at = ?, status = 'queued', message = NULL "
+                "WHERE run_id = ? AND status = 'interrupted' AND finished_at IS NULL",
+                (owner, time.time(), run_id)
+            )
+        return self.get_run(run_id) if cursor.rowcount == 1 else None
+
+    def save_trace(self, run_id, trace):
+        with self._lock, self._connection:
+            self._connection.execute("INSERT OR REPLACE INTO traces VALUES (?, ?)", (run_id, json.dumps(trace)))
+
+    def get_trace(self, run_id):
+        with self._lock:
+            row = self._connection.execute("SELECT trace FROM traces WHERE run_id = ?", (run_id,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def update_run(self, run, owner):
+        # Returns False, writing nothing, once another worker has taken the run over
+        state = run.to_dict()
+        with self._lock, self._connection:
+            cursor = self._connection.execute(
+                "UPDATE runs SET status = ?, counts = ?, message = ?, error = ?, finished_at = ? "
+                "WHERE run_id = ? AND owner = ?",
+                (state['status'], json.dumps(state['counts']), state['message'], state['error'],
+                 state['finished_at'], run.run_id, owner)
+            )
+        return cursor.rowcount == 1
+
+    def update_counts(self, run_id, counts, owner):
+        # Progress only, never overwrites the final state of a run that has just finished
+        with self._lock, self._connection:
+            self._connection.execute(
+                "UPDATE runs SET counts = ? WHERE run_id = ? AND owner = ? AND finished_at IS NULL",
+                (json.dumps(counts), run_id, owner)
+            )
+
+    def get_run(self, run_id):
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT run_id, job_name, target, args, traced, status, counts, message, error, submitted_at, finished_at "
+                "FROM runs WHERE run_id = ?",
+                (run_id,)
+            ).fetchone()
+        return self._run_row(row) if row is not None else None
+
+    def unfinished_runs(self):
+        # Runs that were queued or running when the process stopped, oldest first
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT run_id, job_name, target, args, traced, status, counts, message, error, submitted_at, finished_at "
+                "FROM runs WHERE finished_at IS NULL ORDER BY submitted_at"
+            ).fetchall()
+        return [self._run_row(row) for row in rows]
+
+    def _run_row(self, row):
+        run_id, job_name, target, args, traced, status, counts, message, error, submitted_at, finished_at = row
+        return {
+            'run_id': run_id,
+            'job_name': job_name,
+            'target': target,
+            'args': json.loads(args),
+            'traced': bool(traced),
+            'status': status,
+            'counts': json.loads(counts) if counts else {},
+            'message': message,
+            'error': error,
+            'submitted_at': submitted_at,
+            'finished_at': finished_at
+        }
+
+    def record_candidates(self, run_id, candidates, candidate_folders):
+        # Checkpoint for the listing and candidate.info steps, all in one transaction
+        rows = [(run_id, candidate['id'], json.dumps(candidate), json.dumps(candidate_folders.get(candidate['id'], [])))
+                for candidate in candidates]
+        with self._lock, self._connection:
+            self._connection.executemany("INSERT OR REPLACE INTO candidates VALUES (?, ?, ?, ?)", rows)
+            self._connection.execute("UPDATE runs SET listed = 1 WHERE run_id = ?", (run_id,))
+
+    def record_lookup_failures(self, run_id, lookup_errors, candidate_folders):
+        # lookup_errors as filled in by filter_candidates, a later success clears the candidate
+        rows = [(run_id, error['candidate_id'], error.get('candidate_name'),
+                 json.dumps(candidate_folders.get(error['candidate_id'], [])),
+                 error['error'], classify_error(error['error']))
+                for error in lookup_errors]
+        with self._lock, self._connection:
+            self._connection.executemany("INSERT OR REPLACE INTO lookup_failures VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+    def clear_lookup_failure(self, run_id, candidate_id):
+        with self._lock, self._connection:
+            self._connection.execute(
+                "DELETE FROM lookup_failures WHERE run_id = ? AND candidate_id = ?", (run_id, candidate_id)
+            )
+
+    def lookup_failure_count(self, run_id):
+        # Candidates whose candidate.info lookup failed in the run and hasn't succeeded since
+        with self._lock:
+            return self._connection.execute(
+                "SELECT COUNT(*) FROM lookup_failures WHERE run_id = ?", (run_id,)
+            ).fetchone()[0]
+
+    def listed_candidates(self, run_id):
+        # (candidates, candidate_folders) as checkpointed, or None if the run never got that far
+        with self._lock:
+            listed = self._connection.execute("SELECT listed FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+            if not listed or not listed[0]:
+                return None
+            rows = self._connection.execute(
+                "SELECT candidate, folders FROM candidates WHERE run_id = ? ORDER BY rowid", (run_id,)
+            ).fetchall()
+
+        candidates = []
+        candidate_folders = {}
+        for candidate, folders in rows:
+            candidate = json.loads(candidate)
+            candidates.append(candidate)
+            candidate_folders[candidate['id']] = json.loads(folders)
+        return candidates, candidate_folders
+
+    def record_upload(self, run_id, result):
+        upload_info = result.get('upload_info') or {}
+        error_class = classify_error(result['error']) if result['error'] is not None else None
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO uploads VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (run_id, result['candidate_id'], result['folder_name'], result.get('candidate_name'),
+                 upload_info.get('file_id'), result['error'], time.time(), error_class)
+            )
+
+    def uploaded(self, run_id):
+        # (candidate ID, folder name) -> Drive file ID for every upload the run finished
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT candidate_id, folder_name, file_id FROM uploads WHERE run_id = ? AND error IS NULL",
+                (run_id,)
+            ).fetchall()
+        return {(candidate_id, folder_name): file_id for candidate_id, folder_name, file_id in rows}
+
+    def failures(self, run_id):
+        # Everything the run left failed, one entry per candidate and folder. 'candidate'
+        # is the looked-up candidate for upload failures and None where the lookup failed.
+        with self._lock:
+            lookup_rows = self._connection.execute(
+                "SELECT candidate_id, candidate_name, folders, error, error_class FROM lookup_failures "
+                "WHERE run_id = ? ORDER BY rowid",
+                (run_id,)
+            ).fetchall()
+            upload_rows = self._connection.execute(
+                "SELECT uploads.candidate_id, uploads.candidate_name, uploads.folder_name, uploads.error, "
+                "uploads.error_class, candidates.candidate FROM uploads LEFT JOIN candidates "
+                "ON candidates.run_id = uploads.run_id AND candidates.candidate_id = uploads.candidate_id "
+                "WHERE uploads.run_id = ? AND uploads.error IS NOT NULL ORDER BY uploads.rowid",
+                (run_id,)
+            ).fetchall()
+
+        failures = []
+        for candidate_id, candidate_name, folders, error, error_class in lookup_rows:
+            for folder_name in json.loads(folders):
+                failures.append({
+                    'stage': 'candidate_info',
+                    'candidate_id': candidate_id,
+                    'candidate_name': candidate_name,
+                    'folder_name': folder_name,
+                    'error': error,
+                    'error_class': error_class,
+                    'candidate': None
+                })
+        for candidate_id, candidate_name, folder_name, error, error_class, candidate in upload_rows:
+            failures.append({
+                'stage': 'upload',
+                'candidate_id': candidate_id,
+                'candidate_name': candidate_name,
+                'folder_name': folder_name,
+                'error': error,
+                'error_class': error_class or classify_error(error),
+                'candidate': json.loads(candidate) if candidate else None
+            })
+        return failures
@@ -0,0 +1,289 @@
+import contextlib
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import web_logger
+import events
+import tracing
+from run_journal import RunJournal
+
+# Exports that can run at once, further submissions wait in the executor queue
+RUN_WORKERS = 2
+
+# Finished runs kept around for status polls
+MAX_FINISHED_RUNS = 100
+
+# Progress counts of running runs are written to the journal this often, so a
+# status poll answered by another worker process is at most this far behind
+COUNTS_FLUSH_INTERVAL = 1.0
+
+# A worker renews its lease on the runs it executes every RUN_HEARTBEAT_INTERVAL
+# seconds. Once a lease is RUN_LEASE_SECONDS old the worker is presumed dead and
+# any worker started with start_worker() takes the run over, marking it interrupted
+# until someone resumes it with their API tokens. The lease outlasts
+# two missed heartbeats even if each waits out sqlite_store.BUSY_TIMEOUT.
+RUN_HEARTBEAT_INTERVAL = 10
+RUN_LEASE_SECONDS = 90
+
+# Final status, in this worker only, of a run whose lease was lost
+MOVED_MESSAGE = "Run taken over by another worker"
+
+# A run whose worker stopped can't carry on by itself, its API tokens were only
+# ever held in that worker's memory
+INTERRUPTED_MESSAGE = "The export was interrupted, resume it to carry on where it stopped"
+
+
+class ExportRun:
+    def __init__(self, job_name, traced=False, run_id=None):
+        self.run_id = run_id or uuid.uuid4().hex
+        self.job_name = job_name
+        self.traced = traced
+        self.status = 'queued'
+        self.counts = {
+            'fetched': 0,
+            'shared': 0,
+            'filtered': 0,
+            'uploaded': 0,
+            'copied': 0,
+            'skipped': 0,
+            'resumed': 0,
+            'failed': 0
+        }
+        self.message = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.finished_at = None
+        # Set once another worker has taken the run over, see until_cancelled()
+        self.cancelled = threading.Event()
+        self._lock = threading.Lock()
+
+    def add(self, count_name, amount=1):
+        with self._lock:
+            self.counts[count_name] += amount
+
+    def until_cancelled(self, items):
+        # Stops handing out items once the run is cancelled, the ones in flight still finish
+        for item in items:
+            if self.cancelled.is_set():
+                return
+            yield item
+
+    def raise_if_cancelled(self):
+        # Call before checkpointing, a run taken over must leave the journal to its new owner
+        if self.cancelled.is_set():
+            raise Exception(MOVED_MESSAGE)
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'run_id': self.run_id,
+                'job_name': self.job_name,
+                'status': self.status,
+                'counts': dict(self.counts),
+                'message': self.message,
+                'error': self.error,
+                'traced': self.traced,
+                'submitted_at': self.submitted_at,
+                'finished_at': self.finished_at
+            }
+
+
+# Runs executed by this process, other workers' runs are read from the journal
+_runs = {}
+_runs_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=RUN_WORKERS, thread_name_prefix='export-run')
+
+# Every run is journaled so it survives a restart and is visible to every worker
+journal = RunJournal()
+
+# Target name -> function for runs this process may take over, see start_worker()
+_targets = {}
+_maintainer = None
+_maintainer_lock = threading.Lock()
+
+def _new_worker_id():
+    # The random part tells apart processes that reuse a PID
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+_worker_id = _new_worker_id()
+
+def _reset_after_fork():
+    # A forked worker starts with no runs and no threads of its own
+    global _worker_id, _runs_lock, _executor, _maintainer, _maintainer_lock
+    _worker_id = _new_worker_id()
+    _runs.clear()
+    _runs_lock = threading.Lock()
+    _executor = ThreadPoolExecutor(max_workers=RUN_WORKERS, thread_name_prefix='export-run')
+    _maintainer = None
+    _maintainer_lock = threading.Lock()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+def submit_run(job_name, target, *args, trace=False, credentials=()):
+    # target(run, *credentials, *args) does the export and returns the final message,
+    # with trace=True every span it records is kept for tracing.get_trace(run_id).
+    # args must be JSON serialisable, they are journaled to resume the run with.
+    # credentials, the API tokens, are only held in memory, see resume_run().
+    run = ExportRun(job_name, traced=trace)
+    journal.add_run(run, target.__name__, args, owner=_worker_id)
+    _start(run, target, tuple(credentials) + args)
+    return run
+
+def resume_run(run_id, credentials):
+    # Restarts an interrupted run with the caller's credentials, from its own
+    # checkpoints. None if the run isn't interrupted.
+    row = journal.claim_interrupted(run_id, _worker_id)
+    if row is None:
+        return None
+    run = ExportRun(row['job_name'], traced=row['traced'], run_id=row['run_id'])
+    run.submitted_at = row['submitted_at']
+    web_logger.INFO(f"=== RESUMING EXPORT RUN {run.run_id} ===")
+    _start(run, _targets[row['target']], tuple(credentials) + tuple(row['args']))
+    return run
+
+def start_worker(targets):
+    # Called by every server process: keeps this process's leases alive and its
+    # progress counts journaled, and makes it take over runs left behind by a
+    # worker that stopped heartbeating. targets maps the target function names
+    # given to submit_run back to the functions, for resume_run(). Safe to call on
+    # every request.
+    if _maintainer is None:
+        _targets.update(targets)
+        _ensure_maintainer()
+
+def interrupt_stale_runs(targets):
+    # Every unfinished run whose lease has run out, as another worker or an earlier
+    # process left it, waits as interrupted until resume_run() gets its credentials
+    interrupted = []
+    for row in journal.claim_stale_runs(_worker_id, time.time() - RUN_LEASE_SECONDS):
+        run = ExportRun(row['job_name'], traced=row['traced'], run_id=row['run_id'])
+        run.submitted_at = row['submitted_at']
+        run.counts.update(row['counts'])
+        if row['target'] not in targets:
+            run.status = 'failed'
+            run.error = f"Cannot resume run, unknown target {row['target']}"
+            run.finished_at = time.time()
+            journal.update_run(run, _worker_id)
+            continue
+        web_logger.WARNING("=== EXPORT RUN %s INTERRUPTED, WAITING TO BE RESUMED ===", run.run_id)
+        run.status = 'interrupted'
+        run.message = INTERRUPTED_MESSAGE
+        journal.update_run(run, _worker_id)
+        interrupted.append(run)
+    return interrupted
+
+def _start(run, target, args):
+    with _runs_lock:
+        _runs[run.run_id] = run
+        _prune_runs()
+
+    _ensure_maintainer()
+    _executor.submit(_execute, run, target, args)
+
+def _ensure_maintainer():
+    global _maintainer
+    with _maintainer_lock:
+        if _maintainer is None:
+            _maintainer = threading.Thread(target=_maintain, name='run-maintainer', daemon=True)
+            _maintainer.start()
+
+def _maintain():
+    flushed = {}
+    heartbeat_at = 0
+    while True:
+        try:
+            with _runs_lock:
+                running = [run for run in _runs.values() if run.finished_at is None]
+            for run in running:
+                counts = run.to_dict()['counts']
+                if flushed.get(run.run_id) != counts:
+                    journal.update_counts(run.run_id, counts, _worker_id)
+                    flushed[run.run_id] = counts
+
+            if time.monotonic() - heartbeat_at >= RUN_HEARTBEAT_INTERVAL:
+                heartbeat_at = time.monotonic()
+                for run_id in journal.heartbeat(_worker_id, [run.run_id for run in running]):
+                    _lose(run_id)
+                flushed = {run.run_id: flushed[run.run_id] for run in running if run.run_id in flushed}
+                if _targets:
+                    interrupt_stale_runs(_targets)
+        except Exception as e:
+            web_logger.WARNING("Run maintenance failed: %s", e)
+        time.sleep(COUNTS_FLUSH_INTERVAL)
+
+def _lose(run_id):
+    # Another worker claimed the run while this one was too slow to renew its
+    # lease. It stops taking on candidates and status polls go to the journal.
+    with _runs_lock:
+        run = _runs.pop(run_id, None)
+    if run is not None:
+        web_logger.WARNING("=== EXPORT RUN %s TAKEN OVER BY ANOTHER WORKER ===", run_id)
+        run.cancelled.set()
+
+def is_local(run_id):
+    # Whether this process executes the run, and so publishes its events
+    with _runs_lock:
+        return run_id in _runs
+
+def get_run(run_id):
+    with _runs_lock:
+        run = _runs.get(run_id)
+    if run is not None:
+        return run
+
+    # Run by another worker process, or finished before this one started
+    row = journal.get_run(run_id)
+    if row is None:
+        return None
+    run = ExportRun(row['job_name'], traced=row['traced'], run_id=run_id)
+    run.status = row['status']
+    run.counts.update(row['counts'])
+    run.message = row['message']
+    run.error = row['error']
+    run.submitted_at = row['submitted_at']
+    run.finished_at = row['finished_at']
+    return run
+
+def _execute(run, target, args):
+    if run.cancelled.is_set():
+        return
+    run.status = 'running'
+    if not journal.update_run(run, _worker_id):
+        _lose(run.run_id)
+        return
+    events.publish(run.run_id, 'status', **run.to_dict())
+    recording = tracing.recording(run.run_id) if run.traced else contextlib.nullcontext()
+    trace = None
+    try:
+        with recording as trace, tracing.span('export run', job_name=run.job_name):
+            run.message = target(run, *args)
+        run.status = 'finished'
+    except Exception as e:
+        if not run.cancelled.is_set():
+            web_logger.ERROR("=== EXPORT RUN %s FAILED ===", run.run_id)
+            web_logger.ERROR(str(e))
+        run.error = str(e)
+        run.status = 'failed'
+    run.finished_at = time.time()
+    if trace is not None and not run.cancelled.is_set():
+        # Kept in the journal too, so any worker can serve the download
+        journal.save_trace(run.run_id, trace.to_dict())
+    if run.cancelled.is_set() or not journal.update_run(run, _worker_id):
+        _lose(run.run_id)
+        # Ends the event streams this worker serves, the new owner publishes in its own process
+        run.status = 'moved'
+        run.message = MOVED_MESSAGE
+        run.error = None
+        events.publish(run.run_id, 'status', **run.to_dict())
+        return
+    events.publish(run.run_id, 'status', **run.to_dict())
+
+def _prune_runs():
+    finished = [run for run in _runs.values() if run.finished_at is not None]
+    finished.sort(key=lambda run: run.finished_at)
+    for run in finished[:max(0, len(finished) - MAX_FINISHED_RUNS)]:
+        del _runs[run.run_id]
@@ -1,20 +1,102 @@
-from flask import Flask, render_template, request, session, redirect, url_for
+from flask import Flask, render_template, request, session, redirect, url_for, jsonify, Response
 import json
+import os
+import queue
+import hashlib
+import random
+import time
 from datetime import datetime
-from Test.api_calls_dummy import fetch_jobs, fetch_applications, filter_candidates, add_resumes
-#from api_calls import fetch_jobs, fetch_applications, filter_candidates, add_resumes
+from Test.api_calls_dummy import fetch_jobs, iter_applications, filter_candidates, add_resumes, iter_resume_files
+#from api_calls import fetch_jobs, iter_applications, filter_candidates, add_resumes, iter_resume_files
+#from async_api_calls import sync_api
+#fetch_jobs, iter_applications, filter_candidates, add_resumes, iter_resume_files = sync_api.fetch_jobs, sync_api.iter_applications, sync_api.filter_candidates, sync_api.add_resumes, sync_api.iter_resume_files
+from werkzeug.utils import secure_filename
 import web_logger
+import rate_limiter
+from manifest import SyncManifest
+import runs
+import events
+import metrics
+import tracing
+from cache import DiskLRUCache
+from zip_stream import ZipStream
 
 app = Flask(__name__)
 
+# Idle seconds before the SSE stream sends a comment to keep proxies from closing it
+SSE_KEEPALIVE_SECONDS = 15
+
+# Remembers which resumes already sit in which Drive folder across runs
+manifest = SyncManifest()
+
+# Parsed candidate.info results, reused until the application changes in Ashby
+CANDIDATE_CACHE_PATH = "candidate_cache.db"
+CANDIDATE_CACHE_SIZE = 50000
+candidate_cache = DiskLRUCache(CANDIDATE_CACHE_PATH, CANDIDATE_CACHE_SIZE)
+
+# Retry runs go over transient failures again up to this many times, waiting
+# RETRY_BACKOFF_BASE * 2**round seconds (plus jitter) before each round
+RETRY_ROUNDS = 4
+RETRY_BACKOFF_BASE = 5
+
+# Job lists are cached server-side per Ashby token, the session only keeps the key.
+# On disk so whichever worker process serves the next request finds them.
+JOB_CACHE_PATH = "job_cache.db"
+JOB_CACHE_SIZE = 1024
+JOB_CACHE_TTL = 10 * 60
+job_cache = DiskLRUCache(JOB_CACHE_PATH, JOB_CACHE_SIZE)
+
+# Seconds between journal reads when streaming a run another worker process executes
+RUN_POLL_INTERVAL = 1
+
+# Settings that can come from the environment instead of secrets.json, so every
+# worker of a deployment shares them without a file on each host
+SECRET_ENV_VARS = {
+    'flask_secret_key': 'FLASK_SECRET_KEY',
+    'google_client_id': 'GOOGLE_CLIENT_ID',
+    'google_scopes': 'GOOGLE_SCOPES'
+}
+
+def fresh_jobs(jobs_key):
+    # Jobs cached by any worker, None if missing or older than JOB_CACHE_TTL
+    entry = job_cache.get(jobs_key) if jobs_key else None
+    if entry is None:
+        return None
+    jobs, stored_at = entry
+    if time.time() - stored_at > JOB_CACHE_TTL:
+        return None
+    return jobs
+
+def get_jobs(ashby_token, refresh=False):
+    jobs_key = hashlib.sha256(ashby_token.encode()).hexdigest()
+    session['jobs_key'] = jobs_key
+    jobs = None if refresh else fresh_jobs(jobs_key)
+    if jobs is None:
+        jobs, raw_data = fetch_jobs(ashby_token)
+        web_logger.INFO(f"=== FETCHED {len(jobs)} JOBS ===")
+        for job in jobs:
+            web_logger.DEBUG("Job: %s (ID: %s)", job['name'], job['id'])
+        job_cache.set(jobs_key, jobs)
+    return jobs
+
+def cached_jobs():
+    # Jobs for re-rendering the form, empty if the cache entry has expired
+    return fresh_jobs(session.get('jobs_key')) or []
+
 def load_secrets():
+    file_data = {}
     try:
-        with open('secrets.json', 'r') as file:
-            file_data = json.load(file)
-            return file_data
+        if os.path.exists('secrets.json') or not os.environ.get('FLASK_SECRET_KEY'):
+            with open('secrets.json', 'r') as file:
+                file_data = json.load(file)
     except Exception as e:
         raise Exception(f"ERR_001 : Error loading secrets.json : {str(e)}")
 
+    for key, env_var in SECRET_ENV_VARS.items():
+        if os.environ.get(env_var):
+            file_data[key] = os.environ[env_var]
+    return file_data
+
 secrets = load_secrets()
 
 app.secret_key = secrets.get('flask_secret_key', 'fallback_secret_key_CHANGE_ME')
@@ -41,6 +123,301 @@ def index():
                          google_client_id=secrets.get('google_client_id', ''),
                          google_scopes=secrets.get('google_scopes', ''))
 
+def iter_export_candidates(ashby_token, exports, candidate_folders, count=None):
+    # Candidates of every export in turn, page by page as they are fetched, each one
+    # only once. candidate_folders maps a candidate ID to the folder of every export
+    # they appear in, count (if given) is called with 'fetched' and 'shared'.
+    for export in exports:
+        for candidate in iter_applications(ashby_token, export['filters']):
+            if count is not None:
+                count('fetched')
+            web_logger.DEBUG("Candidate: %s (ID: %s)", candidate['name'], candidate['id'])
+            folders = candidate_folders.get(candidate['id'])
+            if folders is not None:
+                if export['folder_name'] not in folders:
+                    folders.append(export['folder_name'])
+                if count is not None:
+                    count('shared')
+                continue
+            candidate_folders[candidate['id']] = [export['folder_name']]
+            yield candidate
+
+def merge_candidates(candidates, candidate_folders):
+    # candidate.info returns a candidate's current ID, which is not the listed one
+    # once candidates were merged in Ashby. Their folders move over to the current
+    # ID, and listings that turn out to be the same candidate are exported once.
+    merged = {}
+    folders_by_id = {}
+    for candidate in candidates:
+        folders = folders_by_id.setdefault(candidate['id'], [])
+        for name in candidate_folders.get(candidate.get('listed_id', candidate['id']), []):
+            if name not in folders:
+                folders.append(name)
+        merged.setdefault(candidate['id'], candidate)
+
+    for candidate in candidates:
+        if candidate.get('listed_id', candidate['id']) != candidate['id']:
+            candidate_folders.pop(candidate['listed_id'], None)
+    candidate_folders.update(folders_by_id)
+    return list(merged.values())
+
+def result_count(result):
+    # The run count an add_resumes result goes under
+    if result['error'] is not None:
+        return 'failed'
+    if result['upload_info'].get('skipped'):
+        return 'skipped'
+    if result['upload_info'].get('copied_from'):
+        return 'copied'
+    return 'uploaded'
+
+def count_result(run, result):
+    # Checkpoint one add_resumes result, with its Drive file ID or error, and count it
+    runs.journal.record_upload(run.run_id, result)
+    run.add(result_count(result))
+
+def run_export(run, ashby_token, google_token, exports):
+    # exports holds one {'job_name', 'filters', 'folder_name'} per selected job. A candidate
+    # who applied to several of them is looked up and downloaded once, then uploaded
+    # to each of those jobs' folders.
+    candidate_folders = {}
+
+    def on_lookup(candidate, candidate_info, error):
+        if error is not None:
+            run.add('failed')
+        elif candidate_info.get('resume_file_handle') is not None:
+            run.add('filtered')
+        events.publish(run.run_id, 'candidate_info', candidate_id=candidate['id'],
+                       candidate_name=candidate.get('name'), error=error)
+
+    # A run resumed after a restart starts from its checkpointed candidate list
+    checkpoint = runs.journal.listed_candidates(run.run_id)
+    if checkpoint is not None:
+        filtered_candidates, candidate_folders = checkpoint
+        lookup_failures = runs.journal.lookup_failure_count(run.run_id)
+        run.add('filtered', len(filtered_candidates))
+        run.add('failed', lookup_failures)
+        web_logger.INFO(f"=== RESUMING WITH {len(filtered_candidates)} CHECKPOINTED CANDIDATES ===")
+    else:
+        lookup_errors = []
+        try:
+            # Fetch & filter candidates
+            candidates = iter_export_candidates(ashby_token, exports, candidate_folders, run.add)
+            filtered_candidates = filter_candidates(ashby_token, candidates, errors=lookup_errors,
+                                                    on_result=on_lookup, info_cache=candidate_cache)
+        except Exception as e:
+            raise Exception(f"ERR_004 : Error fetching candidates: {str(e)}")
+        web_logger.INFO(f"=== FETCHED {run.counts['fetched']} CANDIDATES FROM {len(exports)} JOBS ===")
+        web_logger.INFO(f"=== APPLIED FILTERS ===")
+        lookup_failures = len(lookup_errors)
+        web_logger.INFO(f"Candidate info errors: {lookup_failures}")
+        web_logger.INFO(f"Applied to more than one job: {run.counts['shared']}")
+        run.raise_if_cancelled()
+        runs.journal.record_lookup_failures(run.run_id, lookup_errors, candidate_folders)
+
+        listed_candidates = len(filtered_candidates)
+        filtered_candidates = merge_candidates(filtered_candidates, candidate_folders)
+        if len(filtered_candidates) < listed_candidates:
+            run.add('filtered', len(filtered_candidates) - listed_candidates)
+            web_logger.INFO(f"Listed under a merged candidate: {listed_candidates - len(filtered_candidates)}")
+
+        web_logger.INFO(f"Filtered count: {len(filtered_candidates)}")
+        if web_logger.is_enabled_for('DEBUG'):
+            for candidate in filtered_candidates:
+                web_logger.DEBUG("Candidate: %s (ID: %s)", candidate['name'], candidate['id'])
+        runs.journal.record_candidates(run.run_id, filtered_candidates, candidate_folders)
+
+    # Only the uploads the run hadn't finished before it was interrupted are left to do
+    uploaded = runs.journal.uploaded(run.run_id)
+    pending_folders = {}
+    for candidate in filtered_candidates:
+        folders = [name for name in candidate_folders.get(candidate['id'], []) if (candidate['id'], name) not in uploaded]
+        if folders:
+            pending_folders[candidate['id']] = folders
+    pending_candidates = [candidate for candidate in filtered_candidates if candidate['id'] in pending_folders]
+    resumed_uploads = len(uploaded)
+    if resumed_uploads:
+        run.add('resumed', resumed_uploads)
+        web_logger.INFO(f"Uploads finished before the restart: {resumed_uploads}")
+
+    try:
+        # Fetch URL, Download and Upload resumes
+        web_logger.INFO(f"=== STARTING RESUME UPLOAD ===")
+        download_results = add_resumes(ashby_token, google_token, run.until_cancelled(pending_candidates), None,
+                                       manifest=manifest, on_result=lambda result: count_result(run, result),
+                                       run_id=run.run_id, candidate_folders=pending_folders)
+    except Exception as e:
+        error_message = f"Error uploading resumes: {str(e)}"
+        web_logger.ERROR("=== RESUME UPLOAD ERROR ===")
+        web_logger.ERROR(error_message)
+        raise Exception(error_message)
+    run.raise_if_cancelled()
+    
+    successful_uploads = resumed_uploads
+    failed_uploads = 0
+    skipped_uploads = 0
+    copied_uploads = 0
+
+    for result in download_results:
+        web_logger.DEBUG("Result: %s %s", result, result['error'] is None)
+        
+        if result['error'] is None:
+            successful_uploads += 1
+            if result['upload_info'].get('skipped'):
+                skipped_uploads += 1
+            elif result['upload_info'].get('copied_from'):
+                copied_uploads += 1
+        else:
+            failed_uploads += 1
+    
+    web_logger.INFO(f"=== RESUME UPLOAD COMPLETE ===")
+    web_logger.INFO(f"Successful uploads: {successful_uploads}")
+    web_logger.INFO(f"Failed uploads: {failed_uploads}")
+    web_logger.INFO(f"Already exported: {skipped_uploads}")
+    web_logger.INFO(f"Copied in Drive: {copied_uploads}")
+    web_logger.INFO(f"Finished before a restart: {resumed_uploads}")
+    web_logger.INFO("========================")
+
+    details = f"{skipped_uploads} already in Drive, {copied_uploads} copied in Drive"
+    if resumed_uploads:
+        details += f", {resumed_uploads} before a restart"
+    # Same failed figure as the run's counts and its retry: uploads plus candidate lookups
+    summary = f"{successful_uploads} successful ({details}), {failed_uploads + lookup_failures} failed"
+    if lookup_failures:
+        summary += f" ({lookup_failures} of them at the candidate lookup)"
+    if len(exports) == 1:
+        return f"Resume upload completed! {summary} out of {len(filtered_candidates) + lookup_failures} candidates."
+    return (f"Resume upload completed! {summary} out of {len(download_results) + resumed_uploads + lookup_failures} "
+            f"resumes for {len(filtered_candidates)} candidates across {len(exports)} jobs.")
+
+def retry_failed(run, ashby_token, google_token, source_run_id):
+    # Re-queues only what source_run_id left failed: candidate.info lookups that
+    # errored and uploads to folders that didn't get the resume. Every failure is
+    # tried once more, then the transient ones (throttling, 5xxs, timeouts) get up
+    # to RETRY_ROUNDS further rounds with exponential backoff in between.
+    # Uploads this retry run already finished, if it is itself being resumed
+    done = runs.journal.uploaded(run.run_id)
+    # Candidate ID -> looked-up candidate, None until candidate.info succeeds
+    candidates = {}
+    names = {}
+    candidate_folders = {}
+    # (candidate ID, folder name) -> error class of its latest attempt
+    failed = {}
+    # (candidate ID, folder name) of candidates that looked up fine but have no resume
+    no_resume = set()
+    for failure in runs.journal.failures(source_run_id):
+        key = (failure['candidate_id'], failure['folder_name'])
+        if key in done:
+            continue
+        failed[key] = failure['error_class']
+        candidates.setdefault(failure['candidate_id'], failure['candidate'])
+        names[failure['candidate_id']] = failure['candidate_name']
+        candidate_folders.setdefault(failure['candidate_id'], []).append(failure['folder_name'])
+    failed_total = len(failed) + len(done)
+    if done:
+        run.add('resumed', len(done))
+    web_logger.INFO(f"=== RETRYING {len(failed)} FAILED RESUMES OF RUN {source_run_id} ===")
+
+    for retry_round in range(RETRY_ROUNDS + 1):
+        retry_classes = ('transient', 'permanent') if retry_round == 0 else ('transient',)
+        retry_ids = [candidate_id for candidate_id, folders in candidate_folders.items()
+                     if any(failed.get((candidate_id, name)) in retry_classes for name in folders)]
+        if not retry_ids:
+            break
+        run.raise_if_cancelled()
+        if retry_round:
+            delay = RETRY_BACKOFF_BASE * 2 ** (retry_round - 1) * random.uniform(0.5, 1)
+            web_logger.INFO(f"Retry round {retry_round} of {RETRY_ROUNDS} for {len(retry_ids)} candidates in {delay:.1f}s")
+            time.sleep(delay)
+
+        to_lookup = [{'id': candidate_id, 'name': names.get(candidate_id)}
+                     for candidate_id in retry_ids if candidates[candidate_id] is None]
+        if to_lookup:
+            lookup_errors = []
+            for candidate in filter_candidates(ashby_token, to_lookup, errors=lookup_errors, info_cache=candidate_cache):
+                # Kept under the ID the failures were recorded with, even if Ashby merged the candidate since
+                candidates[candidate['listed_id']] = dict(candidate, id=candidate['listed_id'])
+            runs.journal.record_lookup_failures(run.run_id, lookup_errors, candidate_folders)
+            lookup_failed = {error['candidate_id']: error['error'] for error in lookup_errors}
+            for candidate in to_lookup:
+                candidate_id = candidate['id']
+                if candidate_id in lookup_failed:
+                    for name in candidate_folders[candidate_id]:
+                        failed[(candidate_id, name)] = rate_limiter.classify_error(lookup_failed[candidate_id])
+                    continue
+                runs.journal.clear_lookup_failure(run.run_id, candidate_id)
+                if candidates[candidate_id] is None:
+                    # Looked up fine but there is no resume on file any more, nothing to retry
+                    for name in candidate_folders[candidate_id]:
+                        if failed.pop((candidate_id, name), None) is not None:
+                            no_resume.add((candidate_id, name))
+
+        to_upload = [candidates[candidate_id] for candidate_id in retry_ids if candidates[candidate_id] is not None]
+        if not to_upload:
+            continue
+        run.raise_if_cancelled()
+        runs.journal.record_candidates(run.run_id, to_upload, candidate_folders)
+        pending_folders = {candidate['id']: [name for name in candidate_folders[candidate['id']]
+                                             if (candidate['id'], name) in failed]
+                           for candidate in to_upload}
+        results = add_resumes(ashby_token, google_token, run.until_cancelled(to_upload), None, manifest=manifest,
+                              run_id=run.run_id, candidate_folders=pending_folders)
+        for result in results:
+            # Failures are counted once, when the retrying is over
+            runs.journal.record_upload(run.run_id, result)
+            key = (result['candidate_id'], result['folder_name'])
+            if result['error'] is None:
+                failed.pop(key, None)
+                run.add(result_count(result))
+            else:
+                failed[key] = rate_limiter.classify_error(result['error'])
+
+    run.add('failed', len(failed))
+    transient = sum(1 for error_class in failed.values() if error_class == 'transient')
+    exported = failed_total - len(failed) - len(no_resume)
+    return (f"Retry completed! {exported} of {failed_total} failed resumes now exported, "
+            f"{len(no_resume)} with no resume on file, {len(failed)} still failing ({transient} of them transient).")
+
+def stream_archive(ashby_token, exports):
+    # Yields a ZIP of every selected candidate's resume, each one written as soon as
+    # its download finishes. With several jobs each gets a directory, and a candidate
+    # in more than one of them is stored under the first.
+    candidate_folders = {}
+    archive = ZipStream()
+    # Candidate IDs already in the archive, listings of a merged candidate share one
+    stored = set()
+    failures = []
+
+    candidates = iter_export_candidates(ashby_token, exports, candidate_folders)
+    for result in iter_resume_files(ashby_token, candidates, info_cache=candidate_cache):
+        if result['error'] is not None:
+            failures.append(result)
+            continue
+        if result['file_data'] is None:
+            continue
+        if result['candidate_id'] in stored:
+            result['file_data']['content'].close()
+            continue
+
+        file_name = result['file_name']
+        if len(exports) > 1:
+            file_name = f"{candidate_folders[result['listed_id']][0]}/{file_name}"
+        try:
+            yield from archive.add(file_name, result['file_data']['content'], result['file_data']['file_size'])
+        finally:
+            result['file_data']['content'].close()
+        stored.add(result['candidate_id'])
+
+    # Failures go into the archive itself, there is no progress page in this mode
+    if failures:
+        lines = [f"{failure['candidate_name']} ({failure['candidate_id']}): {failure['error']}" for failure in failures]
+        yield from archive.add("export_errors.txt", ('\n'.join(lines) + '\n').encode())
+    yield from archive.close()
+
+    web_logger.INFO(f"=== ZIP EXPORT COMPLETE ===")
+    web_logger.INFO(f"Resumes in archive: {len(stored)}")
+    web_logger.INFO(f"Failed: {len(failures)}")
+
 @app.route('/resume_downloader', methods=['GET', 'POST'])
 def resume_downloader():
     ashby_token = session.get('ashby_token')
@@ -51,114 +428,233 @@ def resume_downloader():
         #return redirect(url_for('index'))
     
     if request.method == 'POST':
-        job_data = json.loads(request.form.get('job_id'))
-        selected_job_id = job_data['id']
-        selected_job_name = job_data['name']
+        # Either the jobs picked in the list or every open job
+        if request.form.get('all_open_jobs') == 'on':
+            selected_jobs = [job for job in get_jobs(ashby_token) if job.get('status') == 'Open']
+        else:
+            selected_jobs = [json.loads(value) for value in request.form.getlist('job_id') if value]
+        selected_job_ids = [job['id'] for job in selected_jobs]
         filter_by_date = request.form.get('filter_by_date')
         filter_date = request.form.get('filter_date')
         application_status = request.form.get('application_status')
+        record_trace = request.form.get('record_trace') == 'on'
+        export_mode = request.form.get('export_mode', 'drive')
+
+        if not selected_jobs:
+            return render_template('resume_downloader.html', jobs=cached_jobs(),
+                                 error="Select at least one job, or all open jobs")
         
-        # Create filters dictionary for API call
-        filters = {
-            'jobId': selected_job_id,
+        # Filters shared by every selected job
+        base_filters = {
             'limit': 100  # Default limit from API docs
         }
         
         # Add status filter if selected
         if application_status:
-            filters['status'] = application_status
+            base_filters['status'] = application_status
             
         # Add date filter if enabled and date provided
         if filter_by_date == 'on' and filter_date:
             try:
                 date_obj = datetime.strptime(filter_date, '%Y-%m-%d')
                 unix_timestamp_ms = int(date_obj.timestamp() * 1000)
-                filters['createdAfter'] = unix_timestamp_ms
+                base_filters['createdAfter'] = unix_timestamp_ms
             except ValueError:
                 raise Exception(f"ERR_003 : Invalid date format: {filter_date}")
         
-       
-        
         web_logger.INFO(f"=== FORM SUBMISSION ===")
-        web_logger.INFO(f"Job ID: {selected_job_id}")
+        web_logger.INFO(f"Job IDs: {selected_job_ids}")
         web_logger.INFO(f"Date Filter Enabled: {filter_by_date}")
         web_logger.INFO(f"Selected Date: {filter_date if filter_by_date else 'Not selected'}")
         web_logger.INFO(f"Application Status: {application_status if application_status else 'All Statuses'}")
-        web_logger.INFO(f"API Filters: {filters}")
-        
-        
-        try:
-            # Fetch & filter candidates
-            candidates, raw_data = fetch_applications(ashby_token, filters)
-            web_logger.INFO(f"=== FETCHED {len(candidates)} CANDIDATES ===")
-        except Exception as e:
-            raise Exception(f"ERR_004 : Error fetching candidates: {str(e)}")
-        filtered_candidates = filter_candidates(ashby_token, candidates) 
-        web_logger.INFO(f"=== APPLIED FILTERS ===")
+        web_logger.INFO(f"API Filters: {base_filters}")
 
-        web_logger.INFO(f"Original count: {len(candidates)}")
-        for candidate in candidates:
-            web_logger.INFO(f"Candidate: {candidate['name']} (ID: {candidate['id']})")
-        
-        web_logger.INFO(f"Filtered count: {len(filtered_candidates)}")
-        for candidate in filtered_candidates:
-            web_logger.INFO(f"Candidate: {candidate['name']} (ID: {candidate['id']})")
-        
-        try:
-            # Use job name directly from form, fallback to ID if not provided
-            if not selected_job_name:
-                raise Exception("Job name not found")
-            
-            # Fetch URL, Download and Upload resumes
-            web_logger.INFO(f"=== STARTING RESUME UPLOAD ===")
-            folder_name = f"{selected_job_name}_{application_status}" if application_status else selected_job_name
-            download_results = add_resumes(ashby_token, google_token, filtered_candidates, folder_name)
-            
-            successful_uploads = 0
-            failed_uploads = 0
+        exports = []
+        for job in selected_jobs:
+            # Use job name directly from form
+            if not job.get('name'):
+                return render_template('resume_downloader.html', jobs=cached_jobs(),
+                                     selected_job_ids=selected_job_ids, error="Error uploading resumes: Job name not found")
+            folder_name = f"{job['name']}_{application_status}" if application_status else job['name']
+            exports.append({
+                'job_name': job['name'],
+                'filters': dict(base_filters, jobId=job['id']),
+                'folder_name': folder_name
+            })
 
-            
-            for result in download_results:
-                web_logger.INFO(f"Result: {result} {result['error'] is None}")
-                
-                if result['error'] is None:
-                    successful_uploads += 1
-                else:
-                    failed_uploads += 1
-            
-            web_logger.INFO(f"=== RESUME UPLOAD COMPLETE ===")
-            web_logger.INFO(f"Successful uploads: {successful_uploads}")
-            web_logger.INFO(f"Failed uploads: {failed_uploads}")
-            web_logger.INFO("========================")
-            
-            success_message = f"Resume upload completed! {successful_uploads} successful, {failed_uploads} failed out of {len(filtered_candidates)} candidates."
+        run_name = exports[0]['job_name'] if len(exports) == 1 else f"{len(exports)} jobs"
 
-            
-            return render_template('resume_downloader.html', jobs=session.get('jobs', []), 
-                                 selected_job_id=selected_job_id, candidates=filtered_candidates,
-                                 success_message=success_message)
-        except Exception as e:
-            error_message = f"Error uploading resumes: {str(e)}"
-            web_logger.INFO(f"=== RESUME UPLOAD ERROR ===")
-            web_logger.INFO(error_message)
-            return render_template('resume_downloader.html', jobs=session.get('jobs', []), 
-                                 selected_job_id=selected_job_id, error=error_message)
+        if export_mode == 'zip':
+            # Streamed straight back as a chunked download instead of running in the background
+            web_logger.INFO(f"=== STREAMING ZIP EXPORT OF {run_name} ===")
+            archive_name = secure_filename(run_name) or "resumes"
+            headers = {
+                'Content-Disposition': f'attachment; filename="{archive_name}.zip"',
+                'X-Accel-Buffering': 'no'
+            }
+            return Response(stream_archive(ashby_token, exports), mimetype='application/zip', headers=headers)
+
+        # The export runs in the background, the page polls /runs/<run_id> for progress
+        run = runs.submit_run(run_name, run_export, exports, trace=record_trace,
+                              credentials=(ashby_token, google_token))
+        web_logger.INFO(f"=== SUBMITTED EXPORT RUN {run.run_id} ===")
+
+        return render_template('resume_downloader.html', jobs=cached_jobs(), 
+                             selected_job_ids=selected_job_ids, run_id=run.run_id)
     
     try:
-        jobs, raw_data = fetch_jobs(ashby_token)
-        session['jobs'] = jobs  
-        
-        web_logger.INFO(f"=== FETCHED {len(jobs)} JOBS ===")
-        for job in jobs:
-            web_logger.INFO(f"Job: {job['name']} (ID: {job['id']})")
+        # Served from the job cache unless the user asked for a refresh
+        refresh = request.args.get('refresh') == '1'
+        jobs = get_jobs(ashby_token, refresh=refresh)
+        # Older sessions carried the whole job list in the cookie
+        session.pop('jobs', None)
         
         return render_template('resume_downloader.html', jobs=jobs)
         
     except Exception as e:
         error_message = f"Error fetching jobs: {str(e)}"
-        web_logger.INFO(f"=== ERROR FETCHING JOBS ===")
-        web_logger.INFO(error_message)
+        web_logger.ERROR("=== ERROR FETCHING JOBS ===")
+        web_logger.ERROR(error_message)
         return render_template('resume_downloader.html', jobs=[] , error=error_message)
 
+@app.route('/runs/<run_id>', methods=['GET'])
+def run_status(run_id):
+    run = runs.get_run(run_id)
+    if run is None:
+        return jsonify({'error': 'Run not found'}), 404
+    return jsonify(run.to_dict())
+
+@app.route('/runs/<run_id>/failures', methods=['GET'])
+def run_failures(run_id):
+    # What the run left failed, with each error classed transient or permanent
+    if runs.get_run(run_id) is None:
+        return jsonify({'error': 'Run not found'}), 404
+    failures = runs.journal.failures(run_id)
+    for failure in failures:
+        failure.pop('candidate')
+    return jsonify({'run_id': run_id, 'failures': failures})
+
+@app.route('/runs/<run_id>/retry', methods=['POST'])
+def retry_run(run_id):
+    # Starts a new run that retries only this run's failures, with the caller's tokens
+    ashby_token = session.get('ashby_token')
+    google_token = session.get('google_token')
+    if not ashby_token or not google_token:
+        return redirect(url_for('index'))
+
+    run = runs.get_run(run_id)
+    if run is None:
+        return jsonify({'error': 'Run not found'}), 404
+    if run.finished_at is None:
+        return render_template('resume_downloader.html', jobs=cached_jobs(), run_id=run_id,
+                               error="The run is still going, retry once it has finished")
+    if not runs.journal.failures(run_id):
+        return render_template('resume_downloader.html', jobs=cached_jobs(),
+                               error="The run has no failed candidates to retry")
+
+    retry = runs.submit_run(f"Retry of {run.job_name}", retry_failed, run_id,
+                            credentials=(ashby_token, google_token))
+    web_logger.INFO(f"=== SUBMITTED RETRY RUN {retry.run_id} FOR {run_id} ===")
+    return render_template('resume_downloader.html', jobs=cached_jobs(), run_id=retry.run_id)
+
+@app.route('/runs/<run_id>/resume', methods=['POST'])
+def resume_run(run_id):
+    # Carries on with an interrupted run from its checkpoints, with the caller's tokens
+    ashby_token = session.get('ashby_token')
+    google_token = session.get('google_token')
+    if not ashby_token or not google_token:
+        return redirect(url_for('index'))
+
+    if runs.get_run(run_id) is None:
+        return jsonify({'error': 'Run not found'}), 404
+    if runs.resume_run(run_id, (ashby_token, google_token)) is None:
+        return render_template('resume_downloader.html', jobs=cached_jobs(), run_id=run_id,
+                               error="The run is not interrupted, there is nothing to resume")
+    return render_template('resume_downloader.html', jobs=cached_jobs(), run_id=run_id)
+
+@app.route('/runs/<run_id>/events', methods=['GET'])
+def run_events(run_id):
+    run = runs.get_run(run_id)
+    if run is None:
+        return jsonify({'error': 'Run not found'}), 404
+    if not runs.is_local(run_id):
+        return Response(poll_run_events(run_id), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+    def stream():
+        # Subscribe before taking the snapshot so no event falls in between
+        subscriber = events.subscribe(run_id)
+        try:
+            snapshot = run.to_dict()
+            yield f"event: status\ndata: {json.dumps(snapshot)}\n\n"
+            if snapshot['finished_at'] is not None:
+                return
+
+            while True:
+                try:
+                    event = subscriber.get(timeout=SSE_KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+                if event['type'] == 'status' and event['finished_at'] is not None:
+                    return
+        finally:
+            events.unsubscribe(run_id, subscriber)
+
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    return Response(stream(), mimetype='text/event-stream', headers=headers)
+
+def poll_run_events(run_id):
+    # Events only reach subscribers in the worker process executing the run, the
+    # others follow its journaled status and counts instead of each candidate
+    last = None
+    idle = 0
+    while True:
+        snapshot = runs.get_run(run_id).to_dict()
+        if snapshot != last:
+            yield f"event: status\ndata: {json.dumps(snapshot)}\n\n"
+            last = snapshot
+            idle = 0
+        elif idle >= SSE_KEEPALIVE_SECONDS:
+            yield ": keepalive\n\n"
+            idle = 0
+        if snapshot['finished_at'] is not None or snapshot['status'] == 'interrupted':
+            return
+        time.sleep(RUN_POLL_INTERVAL)
+        idle += RUN_POLL_INTERVAL
+
+@app.route('/runs/<run_id>/trace', methods=['GET'])
+def run_trace(run_id):
+    # Chrome trace JSON, open it in chrome://tracing or ui.perfetto.dev
+    trace = tracing.get_trace(run_id)
+    if trace is not None:
+        trace = trace.to_dict()
+    else:
+        # Recorded by another worker process
+        trace = runs.journal.get_trace(run_id)
+    if trace is None:
+        return jsonify({'error': 'No trace recorded for this run'}), 404
+    headers = {'Content-Disposition': f'attachment; filename="trace_{run_id}.json"'}
+    return Response(json.dumps(trace), mimetype='application/json', headers=headers)
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    # Prometheus scrape target for the upstream API call metrics
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+def start_worker():
+    # Lets this process take over runs a stopped worker left unfinished
+    runs.start_worker({'run_export': run_export, 'retry_failed': retry_failed})
+
+@app.before_request
+def ensure_worker():
+    start_worker()
+
 if __name__ == '__main__':
+    # Under the debug reloader this module runs in a watcher process too, only
+    # the child that serves requests picks up runs a previous process left unfinished
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_worker()
     app.run(debug=True, host='0.0.0.0', port=8080)
@@ -0,0 +1,57 @@
+import os
+import sqlite3
+import threading
+import weakref
+
+# Seconds a write waits for another worker process to release the database
+BUSY_TIMEOUT = 30
+
+# File permissions of a private store
+PRIVATE_MODE = 0o600
+
+# Every open store, so a forked worker can give each one a connection of its own
+_stores = weakref.WeakSet()
+
+
+class SQLiteStore:
+    # Base for the SQLite files every server worker process shares. WAL lets one
+    # process read while another writes, and a process forked from one that had
+    # the store open gets a fresh connection instead of reusing the parent's.
+    # A private store's file is only readable by the server's user, SQLite gives
+    # its -wal and -shm files the same permissions.
+    def __init__(self, path, private=False):
+        self.path = path
+        if private:
+            os.close(os.open(path, os.O_RDWR | os.O_CREAT, PRIVATE_MODE))
+            os.chmod(path, PRIVATE_MODE)
+        self._lock = threading.Lock()
+        # Shared by the worker threads of one process, access is serialised by _lock
+        self._connection = self._connect()
+        _stores.add(self)
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        # Safe with WAL against a process crash, and keeps a commit per checkpoint cheap
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def _add_column(self, table, column, definition):
+        # For files created before the column existed, call inside the connection's transaction
+        columns = [row[1] for row in self._connection.execute(f"PRAGMA table_info({table})")]
+        if column not in columns:
+            self._connection.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+def _reopen_after_fork():
+    # The parent's connection is left alone, closing it here could drop its locks
+    for store in list(_stores):
+        store._lock = threading.Lock()
+        store._connection = store._connect()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reopen_after_fork)
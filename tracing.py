@@ -0,0 +1,155 @@
+import asyncio
+import contextlib
+import contextvars
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Traces kept in memory for download, oldest dropped first
+MAX_TRACES = 20
+
+# Spans recorded per trace before further ones are counted but dropped
+MAX_TRACE_EVENTS = 200000
+
+# The trace being recorded by the current run, copied into pipeline worker threads
+_current = contextvars.ContextVar('trace', default=None)
+
+_traces = OrderedDict()
+_traces_lock = threading.Lock()
+
+
+class Trace:
+    def __init__(self, run_id):
+        self.run_id = run_id
+        self.pid = os.getpid()
+        self.started = time.perf_counter()
+        self.dropped = 0
+        self._events = []
+        self._thread_names = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, category, started, finished, args):
+        thread = threading.current_thread()
+        tid, thread_name = thread.ident, thread.name
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        if task is not None:
+            # Coroutines share the event loop's thread, each task gets its own track
+            tid, thread_name = id(task), f"{thread.name} {task.get_name()}"
+        # Chrome trace "complete" event, times in microseconds from the start of the run
+        event = {
+            'name': name,
+            'cat': category,
+            'ph': 'X',
+            'ts': (started - self.started) * 1e6,
+            'dur': (finished - started) * 1e6,
+            'pid': self.pid,
+            'tid': tid,
+            'args': args
+        }
+        with self._lock:
+            if len(self._events) >= MAX_TRACE_EVENTS:
+                self.dropped += 1
+                return
+            self._events.append(event)
+            self._thread_names.setdefault(tid, thread_name)
+
+    def to_dict(self):
+        # Loads in chrome://tracing and ui.perfetto.dev
+        with self._lock:
+            trace_events = [{
+                'name': 'process_name', 'ph': 'M', 'pid': self.pid,
+                'args': {'name': f"export run {self.run_id}"}
+            }]
+            for tid, thread_name in self._thread_names.items():
+                trace_events.append({
+                    'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': tid,
+                    'args': {'name': thread_name}
+                })
+            trace_events.extend(self._events)
+            dropped = self.dropped
+
+        return {
+            'traceEvents': trace_events,
+            'displayTimeUnit': 'ms',
+            'otherData': {'run_id': self.run_id, 'dropped_events': dropped}
+        }
+
+
+class Span:
+    __slots__ = ('trace', 'name', 'category', 'args', 'started')
+
+    def __init__(self, trace, name, category, args):
+        self.trace = trace
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def set(self, **args):
+        # For values only known once the work is done, like bytes transferred
+        self.args.update(args)
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc is not None:
+            self.args['error'] = str(exc)
+        self.trace.add(self.name, self.category, self.started, time.perf_counter(), self.args)
+        return False
+
+
+class _NoSpan:
+    def set(self, **args):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+# Shared by every span() call made while no trace is recording
+_NO_SPAN = _NoSpan()
+
+def span(name, category='export', **args):
+    # Costs one context variable lookup when the run is not being traced
+    trace = _current.get()
+    if trace is None:
+        return _NO_SPAN
+    return Span(trace, name, category, args)
+
+def is_recording():
+    return _current.get() is not None
+
+def current():
+    return _current.get()
+
+@contextlib.contextmanager
+def attached(trace):
+    # Records into trace from another thread or event loop, e.g. the async API's loop
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+
+@contextlib.contextmanager
+def recording(run_id):
+    # Everything run inside the block, including pipeline workers it starts, is traced
+    trace = Trace(run_id)
+    with _traces_lock:
+        _traces[run_id] = trace
+        while len(_traces) > MAX_TRACES:
+            _traces.popitem(last=False)
+
+    with attached(trace):
+        yield trace
+
+def get_trace(run_id):
+    with _traces_lock:
+        return _traces.get(run_id)
@@ -1,31 +1,196 @@
 import os
+import sys
+import atexit
 import datetime
+import queue
+import threading
+import time
+try:
+    import fcntl
+except ImportError:
+    # No cross-process locking on Windows, run a single process there
+    fcntl = None
+
+LEVELS = {'DEBUG': 10, 'INFO': 20, 'WARNING': 30, 'ERROR': 40}
+
+# Messages below this level are dropped before they are formatted
+DEFAULT_LEVEL = os.environ.get('WEB_LOGGER_LEVEL', 'INFO').upper()
+
+# The log is rotated to .1, .2, ... once it grows past MAX_BYTES. Every server
+# worker process appends to the same file, rotating takes a lock file next to it.
+MAX_BYTES = 10 * 1024 * 1024
+BACKUP_COUNT = 5
+
+# Lines the writer thread pulls off the queue before each write and flush
+WRITE_BATCH = 500
 
 class Logger:
-    def __init__(self, log_file_path="web_logger.log", show_timestamp=False):
+    def __init__(self, log_file_path="web_logger.log", show_timestamp=False, level=DEFAULT_LEVEL,
+                 max_bytes=MAX_BYTES, backup_count=BACKUP_COUNT):
         self.log_file_path = log_file_path
         self.show_timestamp = show_timestamp
-        # Ensure the log file exists
-        if not os.path.exists(self.log_file_path):
-            open(self.log_file_path, 'w').close()
-    
-    def INFO(self, message):
-        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.level = LEVELS[level]
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        # Callers only enqueue, one background thread owns the open file
+        self._queue = queue.SimpleQueue()
+        self._file = None
+        self._writer = None
+        self._writer_lock = threading.Lock()
+        # A forked worker inherits neither the thread nor a usable queue
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def set_level(self, level):
+        self.level = LEVELS[level]
+
+    def is_enabled_for(self, level):
+        return LEVELS[level] >= self.level
+
+    def log(self, level, message, *args):
+        # Formatting with %-style args is skipped entirely when the level is off
+        if LEVELS[level] < self.level:
+            return
+        if args:
+            try:
+                message = message % args
+            except (TypeError, ValueError):
+                message = f"{message} {args}"
+        self._start_writer()
+        self._queue.put((time.time(), level, message))
+
+    def DEBUG(self, message, *args):
+        self.log('DEBUG', message, *args)
+
+    def INFO(self, message, *args):
+        self.log('INFO', message, *args)
+
+    def WARNING(self, message, *args):
+        self.log('WARNING', message, *args)
+
+    def ERROR(self, message, *args):
+        self.log('ERROR', message, *args)
+
+    def flush(self, timeout=5):
+        # Wait until everything logged so far has been written
+        if self._writer is None:
+            return
+        written = threading.Event()
+        self._queue.put(written)
+        written.wait(timeout)
+
+    def close(self):
+        if self._writer is None:
+            return
+        self._queue.put(None)
+        self._writer.join(timeout=5)
+        self._writer = None
+
+    def _start_writer(self):
+        if self._writer is not None:
+            return
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._run, name='web-logger', daemon=True)
+                self._writer.start()
+
+    def _reset_after_fork(self):
+        self._queue = queue.SimpleQueue()
+        self._file = None
+        self._writer = None
+        self._writer_lock = threading.Lock()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            try:
+                while len(batch) < WRITE_BATCH:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+
+            lines = []
+            waiters = []
+            stop = False
+            for item in batch:
+                if item is None:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    lines.append(self._format(*item))
+
+            if lines:
+                self._write(''.join(lines))
+            for waiter in waiters:
+                waiter.set()
+            if stop:
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                return
+
+    def _format(self, created, level, message):
         if self.show_timestamp:
-            log_entry = f"[{timestamp}] INFO: {message}\n"
-        else:
-            log_entry = f"INFO: {message}\n"
-        
+            timestamp = datetime.datetime.fromtimestamp(created).strftime("%Y-%m-%d %H:%M:%S")
+            return f"[{timestamp}] {level}: {message}\n"
+        return f"{level}: {message}\n"
+
+    def _write(self, text):
         try:
-            with open(self.log_file_path, 'a', encoding='utf-8') as log_file:
-                log_file.write(log_entry)
+            if self._file is not None and self._rotated_elsewhere():
+                self._file.close()
+                self._file = None
+            if self._file is None:
+                self._file = open(self.log_file_path, 'a', encoding='utf-8')
+            self._file.write(text)
+            self._file.flush()
+            if self.max_bytes and self._file.tell() >= self.max_bytes:
+                self._rotate()
         except Exception as e:
             # Fallback to print if logging fails
-            print(f"Logging failed: {e}")
-            print(f"[{timestamp}] INFO: {message}")
+            print(f"Logging failed: {e}", file=sys.stderr)
+            print(text, end='', file=sys.stderr)
+            self._file = None
+
+    def _rotated_elsewhere(self):
+        # Another process rotated the log, the open file is now a backup
+        try:
+            return os.stat(self.log_file_path).st_ino != os.fstat(self._file.fileno()).st_ino
+        except FileNotFoundError:
+            return True
+
+    def _rotate(self):
+        self._file.close()
+        self._file = None
+        with open(f"{self.log_file_path}.lock", 'a') as lock_file:
+            # Released when the lock file is closed
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            # Only the first process to find the file oversized rotates it
+            try:
+                if os.path.getsize(self.log_file_path) < self.max_bytes:
+                    return
+            except FileNotFoundError:
+                return
+            if self.backup_count <= 0:
+                os.remove(self.log_file_path)
+                return
+            for index in range(self.backup_count - 1, 0, -1):
+                source = f"{self.log_file_path}.{index}"
+                if os.path.exists(source):
+                    os.replace(source, f"{self.log_file_path}.{index + 1}")
+            os.replace(self.log_file_path, f"{self.log_file_path}.1")
 
 # Create a global logger instance
 _logger = Logger()
+atexit.register(_logger.close)
 
-# Export the INFO method for easy import
-INFO = _logger.INFO 
\ No newline at end of file
+# Export the logging methods for easy import
+DEBUG = _logger.DEBUG
+INFO = _logger.INFO
+WARNING = _logger.WARNING
+ERROR = _logger.ERROR
+is_enabled_for = _logger.is_enabled_for
+set_level = _logger.set_level
+flush = _logger.flush
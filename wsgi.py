@@ -0,0 +1,11 @@
+# Entry point for running several server processes behind a WSGI server, e.g.
+#
+#   gunicorn --workers 4 --threads 8 --timeout 0 wsgi:app
+#
+# Each worker imports the app itself (no --preload), all of them share the run
+# journal, sync manifest and caches through the SQLite files in the working
+# directory. Set FLASK_SECRET_KEY so every worker signs sessions the same way.
+from server import app, start_worker
+
+# Runs left by a worker that died are taken over once their lease runs out
+start_worker()
@@ -0,0 +1,60 @@
+import time
+import zipfile
+
+# Bytes copied from a resume into the archive per write
+ZIP_CHUNK_SIZE = 64 * 1024
+
+
+class _Sink:
+    # Write-only file zipfile writes into, emptied after every write so it
+    # never holds more than one chunk plus a header
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class ZipStream:
+    # Builds a ZIP archive front to back as a series of byte chunks, for sending
+    # as a chunked HTTP response. With nothing to seek back into, zipfile writes
+    # each entry's sizes in a data descriptor after its data. Entries are stored
+    # as is, resumes are PDFs and DOCX files that are already compressed.
+    def __init__(self):
+        self._sink = _Sink()
+        self._zip = zipfile.ZipFile(self._sink, mode='w', compression=zipfile.ZIP_STORED)
+
+    def add(self, name, content, file_size=None):
+        # content is bytes or a file object, yields the archive bytes for this entry
+        info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+        info.compress_type = zipfile.ZIP_STORED
+        if file_size is not None:
+            # Lets zipfile pick Zip64 headers up front for entries over 4 GiB
+            info.file_size = file_size
+
+        with self._zip.open(info, mode='w') as entry:
+            if hasattr(content, 'read'):
+                content.seek(0)
+                while True:
+                    chunk = content.read(ZIP_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    entry.write(chunk)
+                    yield self._sink.drain()
+            else:
+                entry.write(content)
+        yield self._sink.drain()
+
+    def close(self):
+        # Yields the central directory that ends the archive
+        self._zip.close()
+        yield self._sink.drain()